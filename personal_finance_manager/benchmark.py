@@ -0,0 +1,131 @@
+"""
+Timing benchmark for DatabaseManager storage operations.
+
+Seeds a throwaway database and reports how long each operation takes under
+every storage profile, e.g.:
+
+    python benchmark.py --rows 100000 --profile balanced
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from database_manager import DatabaseManager, STORAGE_PROFILES
+
+CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Others"]
+
+
+def make_rows(count: int, seed: int = 42) -> list:
+    """Generates ``count`` random expenses spread over the last five years."""
+    rng = random.Random(seed)
+    this_year = time.localtime().tm_year
+    return [
+        (
+            f"{rng.randint(this_year - 4, this_year)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            round(rng.uniform(1, 500), 2),
+            rng.choice(CATEGORIES),
+            f"Expense {i}",
+        )
+        for i in range(count)
+    ]
+
+
+def run_profile(profile: str, rows: list) -> list:
+    """Runs every benchmark step against a fresh database; returns (step, seconds, rows)."""
+    results = []
+
+    def measure(step, func, *args, count=None):
+        started = time.perf_counter()
+        func(*args)
+        results.append((step, time.perf_counter() - started, count))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "benchmark.db"), profile=profile)
+        try:
+            measure("bulk insert", db.add_expenses_bulk, rows, count=len(rows))
+
+            singles = rows[:2000]
+
+            def insert_each(write_behind):
+                db.write_behind = write_behind
+                for row in singles:
+                    db.add_expense(*row)
+                db.flush()
+                db.write_behind = False
+            measure("single inserts (commit each)", insert_each, False, count=len(singles))
+            measure("single inserts (write-behind)", insert_each, True, count=len(singles))
+            def probe_duplicates():
+                for row in singles:
+                    db.expense_exists(*row)
+            measure("duplicate probes", probe_duplicates, count=len(singles))
+            measure("category totals", db.get_category_totals)
+
+            def scan_totals():
+                db.conn.execute(
+                    "SELECT category_id, SUM(amount) FROM expenses GROUP BY category_id"
+                ).fetchall()
+            measure("category totals (base table scan)", scan_totals)
+            measure("monthly totals", db.get_period_totals, "month")
+            measure("materialize all expenses", db.get_all_expenses, count=len(rows) + 2 * len(singles))
+
+            def stream_all():
+                for _ in db.iter_expenses():
+                    pass
+            measure("stream all expenses", stream_all, count=len(rows) + 2 * len(singles))
+            measure("expenses in last year", db.get_expenses_between, f"{time.localtime().tm_year - 1}-01-01")
+
+            def delete_half():
+                with db.conn:
+                    db.conn.execute("DELETE FROM expenses WHERE id % 2 = 0")
+            measure("delete half", delete_half, count=len(rows) // 2)
+
+            wal_before = db.wal_size()
+            measure("wal checkpoint (passive)", db.checkpoint, "PASSIVE")
+            measure("optimize / analyze", db.optimize)
+            free_before = db.free_pages()
+            measure("incremental vacuum", db.incremental_vacuum, free_before, count=free_before)
+            measure("wal checkpoint (truncate)", db.checkpoint, "TRUNCATE", count=wal_before // 1024)
+            measure("category totals (after maintenance)", db.get_category_totals)
+        finally:
+            db.close()
+
+        # A database created before incremental auto-vacuum: idle maintenance
+        # leaves it alone and the app converts it on a worker thread.
+        legacy_path = os.path.join(tmp, "legacy.db")
+        legacy = sqlite3.connect(legacy_path)
+        legacy.execute("CREATE TABLE legacy_marker (id INTEGER)")
+        legacy.close()
+        db = DatabaseManager(legacy_path, profile=profile)
+        try:
+            db.add_expenses_bulk(rows)
+            with db.conn:
+                db.conn.execute("DELETE FROM expenses WHERE id <= ?", (len(rows) // 2,))
+            measure("maintenance (legacy file)", db.run_maintenance, count=db.free_pages())
+            measure("vacuum convert (own connection)", db.convert_auto_vacuum, count=db.free_pages())
+            measure("maintenance (after conversion)", db.run_maintenance, count=db.free_pages())
+        finally:
+            db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseManager storage operations.")
+    parser.add_argument("--rows", type=int, default=50_000, help="number of expenses to seed")
+    parser.add_argument("--profile", choices=sorted(STORAGE_PROFILES) + ["all"], default="all")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    profiles = sorted(STORAGE_PROFILES) if args.profile == "all" else [args.profile]
+    # The count column is rows for inserts/deletes, pages for the vacuum and
+    # maintenance steps and KiB of WAL for the truncating checkpoint.
+    print(f"{'profile':<10} {'step':<38} {'ms':>10} {'count':>10}")
+    for profile in profiles:
+        for step, seconds, count in run_profile(profile, rows):
+            items = "" if count is None else str(count)
+            print(f"{profile:<10} {step:<38} {seconds * 1000:>10.2f} {items:>10}")
+
+
+if __name__ == "__main__":
+    main()
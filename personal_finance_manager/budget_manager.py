@@ -7,7 +7,8 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import ttkbootstrap as tb
-from database_manager import DatabaseManager
+from database_manager import BUSY_MESSAGE, is_busy_error
+from finance_service import open_database
 from logging_config import logging
 import os,sys
 
@@ -32,11 +33,14 @@ class BudgetManager:
     track actual spending, and compare budgets vs. spending with charts.
     """
 
-    def __init__(self, root, style: tb.Style, on_budget_update=None, db_file: str = None):
+    def __init__(self, root, style: tb.Style, on_budget_update=None, db_file: str = None,
+                 date_range=None, db_options: dict = None):
         self.root = root
         self.style = style
         self._dark = style.theme_use().startswith("dark")
         self.on_budget_update = on_budget_update
+        # Callable returning the (start, end) range spending is measured over.
+        self.date_range = date_range or (lambda: (None, None))
 
         self.root.title("Budget Manager")
         icon_path = resource_path("assets/icon.ico")
@@ -57,7 +61,7 @@ class BudgetManager:
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
         # Database
-        self.db_manager = DatabaseManager(db_file)
+        self.db_manager = open_database(db_file, **(db_options or {}))
         try:
             self.db_manager.create_budget_table()
         except Exception as e:
@@ -66,8 +70,6 @@ class BudgetManager:
             self.root.destroy()
             return
 
-        CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Others"]
-
         # Input frame
         input_frame = tb.Frame(self.root, padding=10)
         input_frame.grid(row=0, column=0, sticky="nsew")
@@ -76,7 +78,7 @@ class BudgetManager:
         tb.Label(input_frame, text="Category:", bootstyle="secondary").grid(
             row=0, column=0, sticky="w", padx=5, pady=5)
         self.category_combobox = tb.Combobox(
-            input_frame, values=CATEGORIES, state="readonly", bootstyle="info"
+            input_frame, values=self.db_manager.get_categories(), state="readonly", bootstyle="info"
         )
         self.category_combobox.set("Select Category")
         self.category_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
@@ -115,11 +117,17 @@ class BudgetManager:
         # Chart container
         chart_frame = tb.Frame(display_frame)
         chart_frame.grid(row=0, column=1, sticky="nsew", padx=(10,0))
-        self.fig = Figure(figsize=(5,4), dpi=100)
-        self.ax = self.fig.add_subplot(111)
+        self.fig = Figure(figsize=(5,6), dpi=100)
+        self.ax = self.fig.add_subplot(211)
+        self.bar_ax = self.fig.add_subplot(212)
         self.canvas = FigureCanvasTkAgg(self.fig, master=chart_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
 
+        # Artists kept between refreshes so they can be updated in place
+        self._pie = None        # (categories, wedges, texts, autotexts)
+        self._bars = None       # (categories, budget bars, spent bars, value labels)
+        self._chart_key = None  # data and theme of the last render
+
         self.draw_piechart()
 
         # Toolbar Buttons
@@ -160,36 +168,61 @@ class BudgetManager:
         self.load_budgets()
 
     def draw_piechart(self):
-        """Initial draw of empty pie chart with theme styling"""
-        bg = self.style.lookup("TFrame","background")
-        self.fig.patch.set_facecolor(bg)
-        self.ax.set_facecolor(bg)
-        title_color = "grey" if self._dark else "black"
-        self.ax.clear()
-        self.ax.text(0.5,0.5,"No Budget Data", ha='center', va='center',
-                     fontsize=12, color=title_color)
-        self.fig.tight_layout()
-        self.canvas.draw()
+        """Initial draw of empty charts with theme styling"""
+        self.update_charts([], [], [])
 
-    def update_piechart(self, categories, budgets):
+    def update_charts(self, categories, budgets, spents, force=False):
         """
-        Update the pie chart with the given categories and budgets.
+        Bring the pie and the budget-vs-spending bars up to date. Artists are
+        updated in place when the categories haven't changed and the canvas
+        is rendered once, and only if the data or theme actually changed.
         """
-        self.ax.clear()
-
-        bg_color = self.style.lookup("TFrame", "background")
-        text_color = "grey" if self._dark else "black"
-
+        categories, budgets, spents = list(categories), list(budgets), list(spents)
+        key = (tuple(categories), tuple(budgets), tuple(spents), self._dark)
+        if key == self._chart_key and not force:
+            return
+        restyle = force or self._chart_key is None or self._chart_key[3] != self._dark
+        layout_changed = self._update_pie(categories, budgets, restyle)
+        layout_changed |= self._update_bars(categories, budgets, spents, restyle)
+        if layout_changed:
+            self.fig.tight_layout()
+        self._chart_key = key
+        self.canvas.draw_idle()
+
+    def _theme_colors(self):
+        return self.style.lookup("TFrame", "background"), "grey" if self._dark else "black"
+
+    def _update_pie(self, categories, budgets, restyle):
+        """Returns True when the axes had to be rebuilt."""
+        bg_color, text_color = self._theme_colors()
+        has_data = bool(budgets) and any(budgets)
+        if has_data and not restyle and self._pie and self._pie[0] == categories:
+            _, wedges, texts, autotexts = self._pie
+            total = float(sum(budgets))
+            theta = 90.0
+            for wedge, text, autotext, value in zip(wedges, texts, autotexts, budgets):
+                span = 360.0 * value / total
+                wedge.set_theta1(theta)
+                wedge.set_theta2(theta + span)
+                mid = np.deg2rad(theta + span / 2)
+                x, y = np.cos(mid), np.sin(mid)
+                text.set_position((1.1 * x, 1.1 * y))
+                text.set_horizontalalignment("left" if x > 0 else "right")
+                autotext.set_position((0.6 * x, 0.6 * y))
+                autotext.set_text(f"{100.0 * value / total:.1f}%")
+                theta += span
+            return False
 
         self.fig.patch.set_facecolor(bg_color)
+        self.ax.clear()
         self.ax.set_facecolor(bg_color)
-
-        if not budgets or not any(budgets):
-
+        if not has_data:
+            self._pie = None
             self.ax.text(
                 0.5, 0.5, "No Budget Data",
                 ha='center', va='center', fontsize=12, color=text_color
             )
+            self.ax.set_axis_off()
         else:
             wedges, texts, autotexts = self.ax.pie(
                 budgets,
@@ -199,12 +232,49 @@ class BudgetManager:
                 colors=plt.cm.Paired.colors
             )
             self.ax.set_title("Budget Distribution", color=text_color)
-
             for txt in texts + autotexts:
                 txt.set_color(text_color)
-
-        self.fig.tight_layout()
-        self.canvas.draw()
+            self._pie = (categories, wedges, texts, autotexts)
+        return True
+
+    def _update_bars(self, categories, budgets, spents, restyle):
+        """Returns True when the axes had to be rebuilt."""
+        bg_color, text_color = self._theme_colors()
+        if categories and not restyle and self._bars and self._bars[0] == categories:
+            _, budget_bars, spent_bars, labels = self._bars
+            for bar, label, height in zip(budget_bars + spent_bars, labels, budgets + spents):
+                bar.set_height(height)
+                label.set_y(height)
+                label.set_text(f"{height:.2f}")
+            self.bar_ax.relim()
+            self.bar_ax.autoscale_view()
+            return False
+
+        self.bar_ax.clear()
+        self.bar_ax.set_facecolor(bg_color)
+        if not categories:
+            self._bars = None
+            self.bar_ax.set_axis_off()
+            return True
+        x = np.arange(len(categories))
+        bar_w = 0.35
+        budget_bars = list(self.bar_ax.bar(x - bar_w/2, budgets, bar_w, label='Budget'))
+        spent_bars = list(self.bar_ax.bar(x + bar_w/2, spents, bar_w, label='Spent'))
+        labels = [
+            self.bar_ax.text(
+                bar.get_x() + bar.get_width()/2, bar.get_height(),
+                f"{bar.get_height():.2f}", ha='center', va='bottom', fontsize=8,
+                color=text_color
+            )
+            for bar in budget_bars + spent_bars
+        ]
+        self.bar_ax.set_xticks(x, categories, rotation=45, ha='right', color=text_color)
+        self.bar_ax.tick_params(colors=text_color)
+        self.bar_ax.set_ylabel('Amount', color=text_color)
+        self.bar_ax.set_title('Budget vs Spending', color=text_color)
+        self.bar_ax.legend(fontsize=8)
+        self._bars = (categories, budget_bars, spent_bars, labels)
+        return True
 
     def on_closing(self):
         self.destroy()
@@ -216,6 +286,13 @@ class BudgetManager:
         self.db_manager.close()
         self.root.destroy()
 
+    def _show_db_error(self, error, message, title="Database Error"):
+        """Show a failed database call, telling lock contention apart from real errors."""
+        if is_busy_error(error):
+            messagebox.showwarning("Database Busy", BUSY_MESSAGE)
+        else:
+            messagebox.showerror(title, message)
+
     def load_budgets(self):
         """
         Load budgets into the table and refresh the pie chart & warning label.
@@ -273,91 +350,46 @@ class BudgetManager:
             self.load_budgets()
         except Exception as e:
             logging.error(f"Failed to set budget: {e}")
-            messagebox.showerror("Database Error", "Failed to set budget. Please try again.")
+            self._show_db_error(e, "Failed to set budget. Please try again.")
 
     def redraw_budget_chart(self):
         """
-        Redraw the pie chart with current budget data, matching the current theme.
+        Redraw the charts with current budget data, matching the current theme.
         """
         if not self.tree.winfo_exists():  # Check if the Treeview widget still exists
             logging.warning("Attempted to redraw chart, but Treeview widget no longer exists.")
             return
-        categories = [self.tree.item(i)['values'][0] for i in self.tree.get_children()]
-        budgets = [float(self.tree.item(i)['values'][1]) for i in self.tree.get_children()]
-        self.update_piechart(categories, budgets)
-
-        self.ax.clear()
-
-        bg_color = self.style.lookup("TFrame", "background")
-        text_color = "grey" if self.style.theme_use().startswith("dark") else "black"
-
-        self.fig.patch.set_facecolor(bg_color)
-        self.ax.set_facecolor(bg_color)
-
-        if not budgets or not any(budgets):
-            self.ax.text(
-                0.5, 0.5, "No Budget Data",
-                ha='center', va='center', fontsize=12, color=text_color
-            )
-        else:
-            wedges, texts, autotexts = self.ax.pie(
-                budgets,
-                labels=categories,
-                autopct="%1.1f%%",
-                startangle=90,
-                colors=plt.cm.Paired.colors
-            )
-            self.ax.set_title("Budget Distribution", color=text_color)
-            for txt in texts + autotexts:
-                txt.set_color(text_color)
-
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self._dark = self.style.theme_use().startswith("dark")
+        categories, budgets, spents = [], [], []
+        for iid in self.tree.get_children():
+            cat, bud_str, spent_str = self.tree.item(iid, 'values')
+            categories.append(cat)
+            budgets.append(float(bud_str))
+            spents.append(float(spent_str))
+        self.update_charts(categories, budgets, spents)
+
+    def refresh_categories(self):
+        """Reload category choices from the database."""
+        self.category_combobox.configure(values=self.db_manager.get_categories())
+        self.load_budgets()
 
     def get_spent_amount(self, category):
-        cursor = self.db_manager.conn.cursor()
-        cursor.execute(
-            "SELECT SUM(amount) FROM expenses WHERE category = ?",
-            (category,)
-        )
-        result = cursor.fetchone()[0]
-        return float(result) if result else 0.0
+        return float(self.get_all_spent_amounts().get(category, 0.0))
 
     def get_all_spent_amounts(self):
-        cursor = self.db_manager.conn.cursor()
-        cursor.execute("SELECT category, SUM(amount) FROM expenses GROUP BY category")
-        return {row[0]: float(row[1]) if row[1] else 0.0 for row in cursor.fetchall()}
+        return self.db_manager.get_category_totals(*self.date_range())
 
     def show_budget_vs_spending(self):
         """
-        Display a bar chart comparing budgets vs actual spending.
+        Refresh the spent column and the embedded budget vs spending bars.
         """
         spent_data = self.get_all_spent_amounts()
-        cats, budgets, spents = [], [], []
         for iid in self.tree.get_children():
-            cat, bud_str, _ = self.tree.item(iid, 'values')
-            bud = float(bud_str)
-            sp = spent_data.get(cat, 0.0)
-            self.tree.set(iid, 'spent', f"{sp:.2f}")
-            cats.append(cat); budgets.append(bud); spents.append(sp)
-
-        x = np.arange(len(cats))
-        bar_w = 0.35
-        plt.figure(figsize=(10, 6))
-        bars1 = plt.bar(x - bar_w/2, budgets, bar_w, label='Budget')
-        bars2 = plt.bar(x + bar_w/2, spents, bar_w, label='Spent')
-        for bar in bars1 + bars2:
-            h = bar.get_height()
-            plt.text(
-                bar.get_x() + bar.get_width()/2, h + 0.05,
-                f"{h:.2f}", ha='center', va='bottom', fontsize=9
-            )
-        plt.xticks(x, cats, rotation=45, ha='right')
-        plt.ylabel('Amount')
-        plt.title('Budget vs Spending')
-        plt.legend()
-        plt.tight_layout()
-        plt.show()
+            cat = self.tree.item(iid, 'values')[0]
+            spent = f"{spent_data.get(cat, 0.0):.2f}"
+            if spent != self.tree.set(iid, 'spent'):
+                self.tree.set(iid, 'spent', spent)
+        self.redraw_budget_chart()
 
     def export_table(self):
         """
@@ -405,15 +437,24 @@ class BudgetManager:
             messagebox.showinfo("Deleted", f"Budget for {cat} deleted.")
         except Exception as e:
             logging.error(f"Delete error: {e}")
-            messagebox.showerror("Deletion Error", "Failed to delete budget.")
+            self._show_db_error(e, "Failed to delete budget.", "Deletion Error")
 
     def update_exceeded_budgets_label(self):
         """
-        Update label to show any categories over budget.
+        Update label to show any categories over budget, or projected to go
+        over by the end of the month.
         """
         rows = self.db_manager.get_all_budgets()
         spent_data = self.get_all_spent_amounts()
         exceeded = [f"{c} (${spent_data.get(c,0):.2f} > ${b:.2f})" for c,b,_ in rows if spent_data.get(c,0) > b]
+        forecast = self.db_manager.get_spending_forecast()
+        at_risk = [f"{c} (${forecast[c][1]:.2f} projected > ${b:.2f})"
+                   for c,b,_ in rows if c in forecast and forecast[c][0] <= b < forecast[c][1]]
+        sections = []
+        if exceeded:
+            sections.append("Exceeded Budgets:\n" + "\n".join(exceeded))
+        if at_risk:
+            sections.append("Projected to Exceed by Month-End:\n" + "\n".join(at_risk))
         self.exceeded_label.config(
-            text="Exceeded Budgets:\n" + "\n".join(exceeded) if exceeded else ""
+            text="\n".join(sections), bootstyle="danger" if exceeded else "warning"
         )
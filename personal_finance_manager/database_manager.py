@@ -1,21 +1,648 @@
+import atexit
+import calendar
+import functools
+import gzip
+import hashlib
+import inspect
+import os
+import random
+import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date as _date, datetime
+from pathlib import Path
 from logging_config import logging  
 
+# SQLite refuses more than 10 attached databases per connection by default.
+MAX_ATTACHED = 8
+
+# Schema of the expenses table in a year archive; {table} is the qualified
+# table name. category_id refers to the live database's categories table;
+# content_hash and fitid let statement imports recognise archived rows.
+ARCHIVE_EXPENSES_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        amount REAL NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        content_hash INTEGER,
+        fitid TEXT
+    )
+"""
+ARCHIVE_COLUMNS = "id, date, amount, category_id, description, content_hash, fitid"
+# Archived rows as Expense records; {db} is the archive's schema alias and
+# {live} the one holding the categories table.
+SELECT_ARCHIVE_SQL = (
+    "SELECT a.id, a.date, a.amount, c.name, a.description "
+    "FROM {db}.expenses a JOIN {live}.categories c ON c.id = a.category_id"
+)
+# Backups carry each archived year's rows in a table named with this prefix
+# and the year, so one file restores the whole history.
+ARCHIVE_BACKUP_PREFIX = "backup_archive_"
+
+# Online backups copy this many pages per step and then yield to other
+# connections for BACKUP_STEP_SLEEP seconds.
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.02
+
+# Connection tuning profiles. cache_size is in KiB when negative, mmap_size in bytes.
+STORAGE_PROFILES = {
+    "safe": {"cache_size": -8000, "mmap_size": 0, "synchronous": "FULL"},
+    "balanced": {"cache_size": -16000, "mmap_size": 64 * 1024 * 1024, "synchronous": "NORMAL"},
+    "fast": {"cache_size": -64000, "mmap_size": 256 * 1024 * 1024, "synchronous": "OFF"},
+}
+
+# Maintenance thresholds.
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024
+ANALYZE_AFTER_WRITES = 1000
+VACUUM_FREE_PAGES = 256
+VACUUM_PAGES_PER_RUN = 1024
+
+# Write-behind batching: queued inserts are committed once this many rows
+# are waiting or the oldest has waited this many seconds.
+WRITE_BEHIND_ROWS = 50
+WRITE_BEHIND_SECONDS = 0.2
+
+# Lock contention: how long a connection waits for another writer before
+# SQLite reports the database busy, and how often a busy write is retried
+# afterwards (exponential backoff from BUSY_BACKOFF_SECONDS, with jitter).
+BUSY_TIMEOUT_SECONDS = 5.0
+BUSY_RETRIES = 4
+BUSY_BACKOFF_SECONDS = 0.05
+BUSY_BACKOFF_MAX_SECONDS = 1.0
+BUSY_MESSAGE = (
+    "The database is busy because another program or window is writing to it. "
+    "Nothing was changed; please try again in a moment."
+)
+
+# Rows fetched per round trip by the streaming iterators.
+ITER_BATCH_SIZE = 500
+
+# Month-end forecasts blend this month's run rate with the daily rate of the
+# last FORECAST_TRAILING_MONTHS, scaled by how the same month compared to an
+# average month over the last FORECAST_SEASON_YEARS.
+FORECAST_TRAILING_MONTHS = 3
+FORECAST_SEASON_YEARS = 3
+
+# Largest database copied into an in-memory read replica (memory_replica=True);
+# beyond it reads fall back to the file.
+REPLICA_MAX_BYTES = 256 * 1024 * 1024
+
+
+# Bumped whenever migrate_schema gains a step; stored in PRAGMA user_version.
+SCHEMA_VERSION = 10
+
+# Categories every new database starts with; users can add their own.
+DEFAULT_CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Others"]
+
+# Shared insert statement taking (date, amount, category_id, description);
+# the content hash is derived from the same parameters.
+INSERT_EXPENSE_SQL = (
+    "INSERT INTO expenses (date, amount, category_id, description, content_hash) "
+    "VALUES (?1, ?2, ?3, ?4, expense_hash(?1, ?2, ?3, ?4))"
+)
+
+# Statement imports: (date, amount, category_id, description, fitid,
+# occurrence). A row with a FITID is deduplicated by the unique fitid index.
+# One without (QIF has none) is the occurrence-th identical transaction in
+# its statement, and is skipped when that many identical expenses exist, so
+# two real identical debits both count while a re-import adds neither.
+IMPORT_EXPENSE_SQL = (
+    "INSERT OR IGNORE INTO expenses (date, amount, category_id, description, content_hash, fitid) "
+    "SELECT ?1, ?2, ?3, ?4, expense_hash(?1, ?2, ?3, ?4), ?5 "
+    "WHERE ?5 IS NOT NULL OR ?6 > "
+    "(SELECT COUNT(*) FROM expenses WHERE content_hash = expense_hash(?1, ?2, ?3, ?4))"
+)
+
+# Units a recurring rule can repeat in; see materialize_recurring.
+RECURRENCE_UNITS = ("day", "week", "month", "year")
+
+# Expense rows as handed to callers, with the category resolved to its name.
+SELECT_EXPENSES_SQL = (
+    "SELECT e.id, e.date, e.amount, c.name, e.description "
+    "FROM expenses e JOIN categories c ON c.id = e.category_id"
+)
+
+
+def expense_hash(date: str, amount: float, category_id: int, description: str) -> int:
+    """
+    Returns a signed 64-bit hash of an expense's normalized content (date,
+    amount in cents, category id, trimmed description) for duplicate detection.
+    """
+    cents = round(float(amount) * 100)
+    key = f"{date}\x1f{cents}\x1f{category_id}\x1f{(description or '').strip()}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class _Record:
+    """
+    Base for slotted row records. Records unpack, index and compare like the
+    tuples they replace, so positional callers keep working.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """sqlite3 row factory building records straight from fetched rows."""
+        return cls(*row)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (_Record, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Expense(_Record):
+    """An expense row, with the category resolved to its name."""
+    __slots__ = ("id", "date", "amount", "category", "description")
+
+    def __init__(self, id, date, amount, category, description):
+        self.id = id
+        self.date = date
+        self.amount = amount
+        self.category = category
+        self.description = description
+
+
+class Budget(_Record):
+    """A budget row for one category."""
+    __slots__ = ("category", "budget", "spent")
+
+    def __init__(self, category, budget, spent):
+        self.category = category
+        self.budget = budget
+        self.spent = spent
+
+
+class ExpenseFilter:
+    """
+    Criteria for iter_expenses. Unset fields don't restrict anything; dates
+    are inclusive YYYY-MM-DD bounds and ``search`` is a case-insensitive
+    substring of the date, amount, category or description.
+    """
+    __slots__ = ("start", "end", "category", "search", "include_archived")
+
+    def __init__(self, start: str = None, end: str = None, category: str = None,
+                 search: str = None, include_archived: bool = False):
+        self.start = start or None
+        self.end = end or None
+        self.category = category or None
+        self.search = search or None
+        self.include_archived = include_archived
+
+    @classmethod
+    def coerce(cls, value):
+        """Accepts an ExpenseFilter, a dict of its fields (as sent over JSON) or None."""
+        if value is None:
+            return cls()
+        if isinstance(value, dict):
+            return cls(**value)
+        return value
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _month_key(year: int, month: int, offset: int = 0) -> str:
+    """Returns the YYYY-MM key ``offset`` months away from year/month."""
+    index = year * 12 + month - 1 + offset
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _months_between(start: str, end: str) -> int:
+    """Number of months from the YYYY-MM key ``start`` up to ``end``."""
+    return (int(end[:4]) * 12 + int(end[5:7])) - (int(start[:4]) * 12 + int(start[5:7]))
+
+
+def is_memory_database(db_name: str) -> bool:
+    """
+    True for ":memory:", temporary ("") and mode=memory URI databases, which
+    a second connection opened by name would not see.
+    """
+    name = str(db_name)
+    return (name in ("", ":memory:") or name.startswith("file::memory:")
+            or (name.startswith("file:") and "mode=memory" in name))
+
+
+def is_busy_error(error) -> bool:
+    """
+    True when ``error`` means another connection holds the lock (SQLITE_BUSY
+    or SQLITE_LOCKED), including busy errors relayed by the finance service.
+    """
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (5, 6)  # SQLITE_BUSY, SQLITE_LOCKED
+    message = str(error).lower()
+    return "database is locked" in message or "database table is locked" in message \
+        or "database is busy" in message
+
+
+def _retry_busy(method):
+    """
+    Re-runs a write ``method`` that failed because the database stayed busy
+    past busy_timeout, backing off exponentially with jitter, and records
+    contention statistics. Nested calls run inside the outer retry loop.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._in_retry:
+            return method(self, *args, **kwargs)
+        stats = self._contention
+        started = time.perf_counter()
+        self._in_retry = True
+        try:
+            for attempt in range(self.busy_retries + 1):
+                try:
+                    return method(self, *args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if not is_busy_error(e):
+                        raise
+                    stats["busy_errors"] += 1
+                    if self.conn.in_transaction:
+                        self.conn.rollback()
+                    if attempt == self.busy_retries:
+                        stats["failures"] += 1
+                        raise
+                    delay = min(BUSY_BACKOFF_MAX_SECONDS, BUSY_BACKOFF_SECONDS * 2 ** attempt)
+                    delay *= random.uniform(0.5, 1.5)
+                    stats["retries"] += 1
+                    stats["backoff_seconds"] += delay
+                    logging.warning(f"Database busy in {method.__name__}; retrying in {delay:.2f}s.")
+                    time.sleep(delay)
+        finally:
+            self._in_retry = False
+            elapsed = time.perf_counter() - started
+            stats["writes"] += 1
+            stats["write_seconds"] += elapsed
+            stats["max_write_seconds"] = max(stats["max_write_seconds"], elapsed)
+    return wrapper
+
+
+def _flush_first(method):
+    """Commits queued write-behind inserts before running ``method``."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._pending:
+            self.flush()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _replica_read(method):
+    """
+    Runs a read ``method`` against the in-memory replica, when there is one,
+    after catching it up with commits made by other connections. Generators
+    are switched over for each batch they produce.
+    """
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator(self, *args, **kwargs):
+            if not self._use_replica():
+                yield from method(self, *args, **kwargs)
+                return
+            replica = self._replica
+            items = method(self, *args, **kwargs)
+            while True:
+                disk, self.conn = self.conn, replica
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    self.conn = disk
+                yield item
+        return generator
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self._use_replica():
+            return method(self, *args, **kwargs)
+        disk, self.conn = self.conn, self._replica
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.conn = disk
+    return wrapper
+
+
+class _ReplayFilter(logging.Filter):
+    """
+    Drops INFO and lower records logged by threads that are replaying a
+    write onto a memory replica, so each write is logged once. Other
+    threads keep logging normally.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def filter(self, record) -> bool:
+        return record.levelno > logging.INFO or record.thread not in self.threads
+
+
+_REPLAY_FILTER = _ReplayFilter()
+logging.getLogger().addFilter(_REPLAY_FILTER)
+
+
+def _mirrored(method):
+    """
+    Applies a write ``method`` to the in-memory replica as well: it runs
+    against the file first, then once more against the replica with the
+    queue, caches and counters as they were beforehand, so both copies see
+    the same statements. Writes that changed nothing are not repeated; if
+    another connection committed meanwhile the replica is copied afresh.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._replica is None or self._mirroring:
+            return method(self, *args, **kwargs)
+        self._mirroring = True
+        try:
+            self._sync_replica()
+            if self._replica is None:
+                return method(self, *args, **kwargs)
+            disk = self.conn
+            pending = self._pending
+            before = self._replica_state()
+            changes, version = disk.total_changes, self._data_version()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception:
+                if disk.total_changes != changes:
+                    self._refresh_replica()
+                raise
+            if disk.total_changes == changes:
+                return result
+            if self._data_version() != version:
+                self._refresh_replica()
+                return result
+
+            after = self._replica_state()
+            flushed = self._pending is not pending
+            self._set_replica_state(before)
+            flush_rows, flush_interval = self.flush_rows, self.flush_interval
+            if flushed:
+                self.flush_rows = 0
+            else:
+                # Queue exactly as the file run did, however much time has passed.
+                self.flush_rows = self.flush_interval = float("inf")
+            self.conn = self._replica
+            _REPLAY_FILTER.threads.add(threading.get_ident())
+            failed = None
+            try:
+                method(self, *args, **kwargs)
+            except Exception as e:
+                failed = e
+            finally:
+                self.conn = disk
+                _REPLAY_FILTER.threads.discard(threading.get_ident())
+                self.flush_rows, self.flush_interval = flush_rows, flush_interval
+                self._set_replica_state(after)
+            if failed is not None:
+                logging.error(f"Failed to apply {method.__name__} to the memory replica: {failed}")
+                self._drop_replica()
+            else:
+                self._check_replica_size()
+            return result
+        finally:
+            self._mirroring = False
+    return wrapper
+
+
+def _refreshes_replica(method):
+    """
+    For writes that must not run twice (archiving moves rows into other
+    files, restoring replaces the database): runs ``method`` against the
+    file only and copies the whole database into the replica afterwards.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._replica is None or self._mirroring:
+            return method(self, *args, **kwargs)
+        self._mirroring = True
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._mirroring = False
+            self._refresh_replica()
+    return wrapper
+
 
 class DatabaseManager:
     """Handles all database operations for expenses."""
 
-    def __init__(self, db_name: str = "expenses.db"):
+    def __init__(self, db_name: str = "expenses.db", profile: str = "balanced", pragmas: dict = None,
+                 *, read_only: bool = False, check_same_thread: bool = True,
+                 write_behind: bool = False, flush_rows: int = WRITE_BEHIND_ROWS,
+                 flush_interval: float = WRITE_BEHIND_SECONDS,
+                 busy_timeout: float = BUSY_TIMEOUT_SECONDS, busy_retries: int = BUSY_RETRIES,
+                 memory_replica: bool = False, replica_max_bytes: int = REPLICA_MAX_BYTES):
         self.db_name = db_name
+        self.read_only = read_only
+        self.write_behind = write_behind
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_since = None
+        self._pending_lock = threading.RLock()
+        self._flush_timer = None
+        self._flush_at_exit = False
+        self._backup_timer = None
+        self._writes_since_analyze = 0
+        self._category_ids = {}
+        self._category_version = None
+        self._rollups_stale = False
+        self._archives_stale = False
+        self.busy_timeout = busy_timeout
+        self.busy_retries = busy_retries
+        self._in_retry = False
+        self._contention = {
+            "writes": 0, "write_seconds": 0.0, "max_write_seconds": 0.0,
+            "busy_errors": 0, "retries": 0, "failures": 0, "backoff_seconds": 0.0,
+        }
+        self.replica_max_bytes = replica_max_bytes
+        self._check_same_thread = check_same_thread
+        self._replica = None
+        self._replica_version = None
+        self._mirroring = False
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.conn.execute("PRAGMA journal_mode = WAL;")
-            self.create_table()
-            self.create_budget_table()
+            if read_only:
+                # Read-only connections expect an existing, initialised database.
+                uri = Path(os.path.abspath(self.db_name)).as_uri() + "?mode=ro"
+                self.conn = sqlite3.connect(uri, uri=True, timeout=busy_timeout,
+                                            check_same_thread=check_same_thread)
+                self._register_functions()
+                self.apply_storage_profile(profile, pragmas)
+            else:
+                # timeout is SQLite's busy_timeout. IMMEDIATE makes implicit
+                # transactions take the write lock up front, so two writers
+                # queue on busy_timeout instead of deadlocking on the upgrade
+                # from a read lock, which fails at once with SQLITE_BUSY.
+                self.conn = sqlite3.connect(self.db_name, uri=True, timeout=busy_timeout,
+                                            isolation_level="IMMEDIATE",
+                                            check_same_thread=check_same_thread)
+                self._register_functions()
+                self._prepare_database(profile, pragmas)
             logging.info(f"Connected to database: {self.db_name}")
         except sqlite3.Error as e:
             logging.error(f"Failed to connect to database: {e}")
             raise
+        if memory_replica and not read_only:
+            self._refresh_replica()
+
+    @_retry_busy
+    def _prepare_database(self, profile: str, pragmas: dict) -> None:
+        """
+        Configures the connection and brings the schema up to date. Every
+        step is idempotent, so a start-up that races another process's
+        write is simply retried.
+        """
+        # Only takes effect on a brand-new database; existing ones are
+        # converted by convert_auto_vacuum once they have enough free pages.
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA foreign_keys = ON;")
+        self.apply_storage_profile(profile, pragmas)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self) -> None:
+        """Migrates and completes the schema; also run on a freshly restored backup."""
+        self.migrate_schema()
+        self.create_category_table()
+        self.create_recurring_table()
+        self.create_table()
+        self.create_budget_table()
+        self.create_archive_tables()
+        self.create_rollup_table()
+        self.create_undo_table()
+        self.create_payee_rule_table()
+        if self._archives_stale:
+            self._migrate_archives()
+        if self._rollups_stale:
+            self.check_rollups(rebuild=True)
+
+    def _register_functions(self, conn=None) -> None:
+        (conn or self.conn).create_function("expense_hash", 4, expense_hash, deterministic=True)
+
+    # --- In-memory read replica ---------------------------------------------
+    #
+    # With memory_replica=True the database is copied into a private
+    # in-memory connection at start-up. Read methods (@_replica_read) query
+    # the copy; write methods (@_mirrored) run against the file and then the
+    # copy. Commits by other connections (another window, the service, a
+    # second process) bump the file's data_version, after which the copy is
+    # reloaded before the next read. A database, or a copy grown, past
+    # replica_max_bytes is read from the file instead.
+
+    @property
+    def replica_active(self) -> bool:
+        """True while reads are served from the in-memory replica."""
+        return self._replica is not None
+
+    @staticmethod
+    def _database_bytes(conn) -> int:
+        page_count = conn.execute("PRAGMA page_count;").fetchone()[0]
+        return page_count * conn.execute("PRAGMA page_size;").fetchone()[0]
+
+    def _data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version;").fetchone()[0]
+
+    def _refresh_replica(self) -> None:
+        """Copies the database file into a new in-memory replica, if it fits the limit."""
+        # An iterator still reading the old copy keeps it alive until it finishes.
+        self._replica = None
+        try:
+            size = self._database_bytes(self.conn)
+            if size > self.replica_max_bytes:
+                logging.warning(
+                    f"Database is {size} bytes, over the memory replica limit of "
+                    f"{self.replica_max_bytes}; reading from disk."
+                )
+                return
+            started = time.perf_counter()
+            replica = sqlite3.connect("file::memory:", uri=True, isolation_level="IMMEDIATE",
+                                      check_same_thread=self._check_same_thread)
+            replica.execute("PRAGMA foreign_keys = ON;")
+            self._register_functions(replica)
+            self.conn.backup(replica)
+            self._replica = replica
+            self._replica_version = self._data_version()
+            logging.info(f"Loaded {size} bytes into the memory replica in "
+                         f"{time.perf_counter() - started:.3f}s.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load the memory replica; reading from disk: {e}")
+
+    def _drop_replica(self, reason: str = None) -> None:
+        if reason:
+            logging.warning(f"Memory replica disabled, reading from disk: {reason}")
+        self._replica = None
+
+    def _check_replica_size(self) -> None:
+        if self._replica is not None:
+            size = self._database_bytes(self._replica)
+            if size > self.replica_max_bytes:
+                self._drop_replica(f"it grew to {size} bytes, over the limit of {self.replica_max_bytes}")
+
+    def _sync_replica(self) -> None:
+        """Reloads the replica if another connection has committed to the file since."""
+        if self._replica is not None and self._data_version() != self._replica_version:
+            logging.info("Database changed by another connection; reloading the memory replica.")
+            self._refresh_replica()
+
+    def _use_replica(self) -> bool:
+        """Whether a read should go to the replica: not mid-write, not inside a transaction."""
+        if self._replica is None or self._mirroring or self.conn is self._replica \
+                or self.conn.in_transaction:
+            return False
+        self._sync_replica()
+        return self._replica is not None
+
+    def _replica_state(self) -> tuple:
+        """The Python-side state a write touches, so it can be replayed against the replica."""
+        return (list(self._pending), self._pending_since, self._writes_since_analyze,
+                dict(self._contention), dict(self._category_ids), self._rollups_stale)
+
+    def _set_replica_state(self, state: tuple) -> None:
+        (self._pending, self._pending_since, self._writes_since_analyze,
+         self._contention, self._category_ids, self._rollups_stale) = state
+
+    def apply_storage_profile(self, profile: str = "balanced", pragmas: dict = None) -> None:
+        """Applies the cache_size/mmap_size/synchronous settings of a storage profile."""
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Unknown storage profile: {profile}")
+        settings = {**STORAGE_PROFILES[profile], **(pragmas or {})}
+        try:
+            self.conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])};")
+            self.conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])};")
+            synchronous = str(settings["synchronous"]).upper()
+            if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+                raise ValueError(f"Invalid synchronous setting: {synchronous}")
+            self.conn.execute(f"PRAGMA synchronous = {synchronous};")
+            logging.info(f"Applied storage profile {profile}: {settings}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to apply storage profile {profile}: {e}")
+            raise
 
     def __enter__(self):
         return self
@@ -33,23 +660,258 @@ class DatabaseManager:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     date TEXT NOT NULL,
                     amount REAL NOT NULL,
-                    category TEXT NOT NULL,
-                    description TEXT
+                    category_id INTEGER NOT NULL REFERENCES categories(id),
+                    description TEXT,
+                    content_hash INTEGER,
+                    fitid TEXT,
+                    recurring_rule_id INTEGER REFERENCES recurring_rules(id) ON DELETE SET NULL
                 )
                 """
             )
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_expense_hash ON expenses (content_hash)")
+            # Bank transaction ids of imported statements; manual entries have none.
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_expense_fitid ON expenses (fitid) WHERE fitid IS NOT NULL"
+            )
+            # One occurrence per recurring rule and date, so materializing is idempotent.
             cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_expense_lookup
-                ON expenses (date, amount, category, description)
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_expense_recurrence
+                ON expenses (recurring_rule_id, date) WHERE recurring_rule_id IS NOT NULL
                 """
             )
+            # Date-leading so range filters are index range scans; the other
+            # columns the expense list reads ride along, so it never visits
+            # the table.
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_expense_date ON expenses (date, category_id, amount, description)"
+            )
             self.conn.commit()
             logging.info("Expenses table created or already exists.")
         except sqlite3.Error as e:
             logging.error(f"Failed to create expenses table: {e}")
             raise
 
+    def migrate_schema(self) -> None:
+        """
+        Brings an existing database up to SCHEMA_VERSION, one step at a time.
+        Runs before the create_* methods, which always build the latest schema.
+        """
+        try:
+            version = self.conn.execute("PRAGMA user_version;").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+            cursor = self.conn.cursor()
+            self.conn.execute("BEGIN IMMEDIATE;")
+            if not self._table_exists("expenses"):
+                # Brand-new database: the create_* methods build the latest schema.
+                version = SCHEMA_VERSION
+            if version < 1:
+                # Duplicate detection probes a narrow hash index instead of the
+                # wide (date, amount, category, description) index.
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(expenses)")}
+                if "content_hash" not in columns:
+                    cursor.execute("ALTER TABLE expenses ADD COLUMN content_hash INTEGER")
+                cursor.execute(
+                    """
+                    UPDATE expenses
+                    SET content_hash = expense_hash(date, amount, category, description)
+                    WHERE content_hash IS NULL
+                    """
+                )
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_expense_hash ON expenses (content_hash)")
+                cursor.execute("DROP INDEX IF EXISTS idx_expense_lookup")
+            if version < 2:
+                self._migrate_categories(cursor)
+            if version < 3:
+                # Filled from the base tables (archives included) once the
+                # migration has committed, since ATTACH can't run inside it.
+                self.create_rollup_table(commit=False)
+                self._rollups_stale = True
+            if version < 4:
+                # Statement imports record the bank's transaction id (FITID);
+                # create_table adds its unique index.
+                cursor.execute("ALTER TABLE expenses ADD COLUMN fitid TEXT")
+                if self._table_exists("undo_snapshot"):
+                    cursor.execute("ALTER TABLE undo_snapshot ADD COLUMN fitid TEXT")
+            if version < 5:
+                # Adds the monthly rollup; seeded from the daily one, which
+                # is empty here if step 3 just created it (see above).
+                self.create_rollup_table(commit=False)
+                cursor.execute("DELETE FROM monthly_spending")
+                cursor.execute(
+                    """
+                    INSERT INTO monthly_spending (month, category_id, total, count)
+                    SELECT substr(day, 1, 7), category_id, SUM(total), SUM(count)
+                    FROM daily_spending GROUP BY substr(day, 1, 7), category_id
+                    """
+                )
+            if version < 6:
+                # Expenses generated from a recurring rule point back at it;
+                # create_table adds the (rule, date) unique index.
+                self.create_recurring_table(commit=False)
+                cursor.execute(
+                    "ALTER TABLE expenses ADD COLUMN recurring_rule_id INTEGER "
+                    "REFERENCES recurring_rules(id) ON DELETE SET NULL"
+                )
+                if self._table_exists("undo_snapshot"):
+                    cursor.execute("ALTER TABLE undo_snapshot ADD COLUMN recurring_rule_id INTEGER")
+            if version < 7:
+                # Archives switch from category names to ids, so renames reach
+                # archived rows too. Done after this commits (ATTACH again).
+                self._archives_stale = True
+            if version < 8:
+                # Per-year totals of archived years; the rollups cover them.
+                cursor.execute("DROP TABLE IF EXISTS year_totals")
+            if version < 9:
+                # Archives keep content_hash and fitid for statement imports.
+                self._archives_stale = True
+            if version < 10:
+                # idx_expense_date now covers the expense list; create_table
+                # builds the wider index.
+                cursor.execute("DROP INDEX IF EXISTS idx_expense_date")
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+            self.conn.commit()
+            logging.info(f"Migrated database schema from version {version} to {SCHEMA_VERSION}.")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logging.error(f"Failed to migrate database schema: {e}")
+            raise
+
+    def _table_exists(self, name: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+
+    def _migrate_archives(self) -> None:
+        """
+        Rebuilds archives in an older format with the current schema: category
+        names become ids (adding any name the categories table lacks) and
+        content hashes are filled in; FITIDs of rows archived before they
+        were kept stay empty. Archives already current are left alone.
+        """
+        for year in self.get_archived_years():
+            path = self.archive_path(year)
+            if not os.path.exists(path):
+                continue
+            alias = f"archive_{year}"
+            self.conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            try:
+                columns = {row[1] for row in self.conn.execute(f"PRAGMA {alias}.table_info(expenses)")}
+                if "category" not in columns and "content_hash" in columns:
+                    continue
+                cursor = self.conn.cursor()
+                self.conn.execute("BEGIN IMMEDIATE;")
+                if "category" in columns:
+                    cursor.execute(f"INSERT OR IGNORE INTO main.categories (name) SELECT DISTINCT category FROM {alias}.expenses")
+                    source = f"{alias}.expenses a JOIN main.categories c ON c.name = a.category"
+                    category_id = "c.id"
+                else:
+                    source, category_id = f"{alias}.expenses a", "a.category_id"
+                fitid = "a.fitid" if "fitid" in columns else "NULL"
+                cursor.execute(ARCHIVE_EXPENSES_SQL.format(table=f"{alias}.expenses_new"))
+                cursor.execute(
+                    f"""
+                    INSERT INTO {alias}.expenses_new ({ARCHIVE_COLUMNS})
+                    SELECT a.id, a.date, a.amount, {category_id}, a.description,
+                           expense_hash(a.date, a.amount, {category_id}, a.description), {fitid}
+                    FROM {source}
+                    """
+                )
+                cursor.execute(f"DROP TABLE {alias}.expenses")
+                cursor.execute(f"ALTER TABLE {alias}.expenses_new RENAME TO expenses")
+                self.conn.commit()
+                logging.info(f"Migrated archive {path} to the current format.")
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                logging.error(f"Failed to migrate archive {path}: {e}")
+                raise
+            finally:
+                self.conn.execute(f"DETACH DATABASE {alias}")
+        self._archives_stale = False
+
+    def _migrate_categories(self, cursor) -> None:
+        """
+        Moves category names into the categories table and rewrites
+        expenses and budgets to reference them by integer id.
+        """
+        self.create_category_table(commit=False)
+        for table in ("expenses", "budgets"):
+            if self._table_exists(table):
+                cursor.execute(f"INSERT OR IGNORE INTO categories (name) SELECT DISTINCT category FROM {table}")
+
+        # Keep AUTOINCREMENT from handing out ids of deleted or archived rows.
+        seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'expenses'").fetchone()
+        cursor.execute(
+            """
+            CREATE TABLE expenses_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                description TEXT,
+                content_hash INTEGER
+            )
+            """
+        )
+        cursor.execute(
+            """
+            INSERT INTO expenses_new (id, date, amount, category_id, description, content_hash)
+            SELECT e.id, e.date, e.amount, c.id, e.description,
+                   expense_hash(e.date, e.amount, c.id, e.description)
+            FROM expenses e JOIN categories c ON c.name = e.category
+            """
+        )
+        cursor.execute("DROP TABLE expenses")
+        cursor.execute("ALTER TABLE expenses_new RENAME TO expenses")
+        cursor.execute("CREATE INDEX idx_expense_hash ON expenses (content_hash)")
+        if seq:
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'expenses'", seq)
+
+        if self._table_exists("budgets"):
+            cursor.execute(
+                """
+                CREATE TABLE budgets_new (
+                    category_id INTEGER PRIMARY KEY REFERENCES categories(id),
+                    budget REAL NOT NULL,
+                    spent REAL DEFAULT 0
+                )
+                """
+            )
+            cursor.execute(
+                """
+                INSERT INTO budgets_new (category_id, budget, spent)
+                SELECT c.id, b.budget, b.spent FROM budgets b JOIN categories c ON c.name = b.category
+                """
+            )
+            cursor.execute("DROP TABLE budgets")
+            cursor.execute("ALTER TABLE budgets_new RENAME TO budgets")
+
+        logging.info("Migrated categories to the categories table.")
+
+    def create_category_table(self, commit: bool = True) -> None:
+        """Creates the categories table and seeds the default categories."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS categories (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+                )
+                """
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO categories (name) VALUES (?)",
+                [(name,) for name in DEFAULT_CATEGORIES]
+            )
+            if commit:
+                self.conn.commit()
+            logging.info("Categories table created or already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create categories table: {e}")
+            raise
+
     def create_budget_table(self) -> None:
         """Creates the budgets table if it doesn't already exist."""
         try:
@@ -57,7 +919,7 @@ class DatabaseManager:
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS budgets (
-                    category TEXT PRIMARY KEY,
+                    category_id INTEGER PRIMARY KEY REFERENCES categories(id),
                     budget REAL NOT NULL,
                     spent REAL DEFAULT 0
                 )
@@ -69,64 +931,595 @@ class DatabaseManager:
             logging.error(f"Failed to create budgets table: {e}")
             raise
 
+    def create_archive_tables(self) -> None:
+        """Creates the bookkeeping tables for year archives if they don't already exist."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS archived_years (
+                    year INTEGER PRIMARY KEY,
+                    archived_at TEXT NOT NULL
+                )
+                """
+            )
+            self.conn.commit()
+            logging.info("Archive tables created or already exist.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create archive tables: {e}")
+            raise
+
+    def create_undo_table(self) -> None:
+        """
+        Creates the table holding the rows touched by the last bulk operation,
+        as they were before it ran.
+        """
+        try:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS undo_snapshot (
+                    id INTEGER PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    description TEXT,
+                    content_hash INTEGER,
+                    operation TEXT NOT NULL,
+                    fitid TEXT,
+                    recurring_rule_id INTEGER
+                )
+                """
+            )
+            self.conn.commit()
+            logging.info("Undo snapshot table created or already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create undo snapshot table: {e}")
+            raise
+
+    def create_payee_rule_table(self) -> None:
+        """
+        Creates the table mapping payee text to categories for statement
+        imports. A rule matches when its pattern occurs in the payee,
+        ignoring case.
+        """
+        try:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS payee_rules (
+                    pattern TEXT PRIMARY KEY COLLATE NOCASE,
+                    category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+                    priority INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self.conn.commit()
+            logging.info("Payee rules table created or already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create payee rules table: {e}")
+            raise
+
+    def create_recurring_table(self, commit: bool = True) -> None:
+        """
+        Creates the table of recurring expenses. ``materialized_through`` is
+        the last date up to which a rule's occurrences have been generated.
+        """
+        try:
+            self.conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS recurring_rules (
+                    id INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    category_id INTEGER NOT NULL REFERENCES categories(id),
+                    start_date TEXT NOT NULL,
+                    end_date TEXT,
+                    interval_unit TEXT NOT NULL CHECK (interval_unit IN {RECURRENCE_UNITS}),
+                    interval_count INTEGER NOT NULL DEFAULT 1 CHECK (interval_count > 0),
+                    materialized_through TEXT
+                )
+                """
+            )
+            if commit:
+                self.conn.commit()
+            logging.info("Recurring rules table created or already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create recurring rules table: {e}")
+            raise
+
+    def create_rollup_table(self, commit: bool = True) -> None:
+        """
+        Creates the per-day, per-category spending rollup and the triggers
+        that keep it in step with every insert, update and delete on expenses,
+        plus a per-month rollup kept in step with the daily one.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS daily_spending (
+                    day TEXT NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, category_id)
+                ) WITHOUT ROWID
+                """
+            )
+            add_new = """
+                INSERT INTO daily_spending (day, category_id, total, count)
+                VALUES (NEW.date, NEW.category_id, NEW.amount, 1)
+                ON CONFLICT(day, category_id) DO UPDATE
+                SET total = total + excluded.total, count = count + 1;
+            """
+            remove_old = """
+                UPDATE daily_spending SET total = total - OLD.amount, count = count - 1
+                WHERE day = OLD.date AND category_id = OLD.category_id;
+                DELETE FROM daily_spending
+                WHERE day = OLD.date AND category_id = OLD.category_id AND count <= 0;
+            """
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON expenses BEGIN {add_new} END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON expenses BEGIN {remove_old} END"
+            )
+            cursor.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+                AFTER UPDATE OF date, amount, category_id ON expenses
+                BEGIN {remove_old} {add_new} END
+                """
+            )
+
+            # The monthly rollup follows the daily one, so rebuilding or
+            # archiving the daily rollup carries over without extra work.
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS monthly_spending (
+                    month TEXT NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (month, category_id)
+                ) WITHOUT ROWID
+                """
+            )
+            add_month = """
+                INSERT INTO monthly_spending (month, category_id, total, count)
+                VALUES (substr(NEW.day, 1, 7), NEW.category_id, NEW.total, NEW.count)
+                ON CONFLICT(month, category_id) DO UPDATE
+                SET total = total + excluded.total, count = count + excluded.count;
+            """
+            subtract_month = """
+                UPDATE monthly_spending SET total = total - OLD.total, count = count - OLD.count
+                WHERE month = substr(OLD.day, 1, 7) AND category_id = OLD.category_id;
+            """
+            drop_empty_month = """
+                DELETE FROM monthly_spending
+                WHERE month = substr(OLD.day, 1, 7) AND category_id = OLD.category_id AND count <= 0;
+            """
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_monthly_insert AFTER INSERT ON daily_spending BEGIN {add_month} END"
+            )
+            cursor.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_monthly_delete AFTER DELETE ON daily_spending
+                BEGIN {subtract_month} {drop_empty_month} END
+                """
+            )
+            # Daily rows only ever change total and count; a day that empties
+            # is deleted right after, which drops the empty month too.
+            cursor.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS trg_monthly_update AFTER UPDATE OF total, count ON daily_spending
+                BEGIN
+                    UPDATE monthly_spending
+                    SET total = total + NEW.total - OLD.total, count = count + NEW.count - OLD.count
+                    WHERE month = substr(NEW.day, 1, 7) AND category_id = NEW.category_id;
+                END
+                """
+            )
+            if commit:
+                self.conn.commit()
+            logging.info("Spending rollup table created or already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to create spending rollup table: {e}")
+            raise
+
+    @_mirrored
+    @_flush_first
+    def check_rollups(self, rebuild: bool = False) -> int:
+        """
+        Recomputes the daily rollup from the expenses table and the archives,
+        and the monthly rollup from the daily one, and returns how many
+        entries disagree. With ``rebuild`` the rollups are replaced by the
+        recomputed values.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT date, category_id, SUM(amount), COUNT(*) FROM expenses GROUP BY date, category_id"
+            )
+            rows = cursor.fetchall()
+            missing = set()
+            for year in self.get_archived_years():
+                if not self._archive_available(year):
+                    # Nothing to recompute from; trust the rollup for that year.
+                    missing.add(str(year))
+                    continue
+                rows.extend(self._read_archive(
+                    year,
+                    """
+                    SELECT date, category_id, SUM(amount), COUNT(*)
+                    FROM {db}.expenses GROUP BY date, category_id
+                    """
+                ))
+            expected = {}
+            for day, cat_id, total, count in rows:
+                old_total, old_count = expected.get((day, cat_id), (0.0, 0))
+                expected[(day, cat_id)] = (old_total + total, old_count + count)
+
+            cursor.execute("SELECT day, category_id, total, count FROM daily_spending")
+            actual = {(day, cat_id): (total, count) for day, cat_id, total, count in cursor.fetchall()}
+            expected.update((key, value) for key, value in actual.items() if key[0][:4] in missing)
+            mismatches = sum(
+                1 for key in expected.keys() | actual.keys()
+                if key not in expected or key not in actual
+                or expected[key][1] != actual[key][1]
+                or abs(expected[key][0] - actual[key][0]) > 0.005
+            )
+            if rebuild and (mismatches or self._rollups_stale):
+                self.conn.execute("BEGIN IMMEDIATE;")
+                cursor.execute("DELETE FROM daily_spending")
+                cursor.executemany(
+                    "INSERT INTO daily_spending (day, category_id, total, count) VALUES (?, ?, ?, ?)",
+                    [(day, cat_id, total, count) for (day, cat_id), (total, count) in expected.items()]
+                )
+                self.conn.commit()
+                self._rollups_stale = False
+                logging.info(f"Rebuilt spending rollup ({mismatches} mismatched entries).")
+
+            monthly_mismatches = self._check_monthly_rollup(rebuild)
+            return mismatches + monthly_mismatches
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            logging.error(f"Failed to check spending rollup: {e}")
+            raise
+
+    def _check_monthly_rollup(self, rebuild: bool) -> int:
+        """Compares the monthly rollup with the daily one; see check_rollups."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT substr(day, 1, 7), category_id, SUM(total), SUM(count)
+            FROM daily_spending GROUP BY substr(day, 1, 7), category_id
+            """
+        )
+        expected = {(month, cat_id): (total, count) for month, cat_id, total, count in cursor.fetchall()}
+        cursor.execute("SELECT month, category_id, total, count FROM monthly_spending")
+        actual = {(month, cat_id): (total, count) for month, cat_id, total, count in cursor.fetchall()}
+        mismatches = sum(
+            1 for key in expected.keys() | actual.keys()
+            if key not in expected or key not in actual
+            or expected[key][1] != actual[key][1]
+            or abs(expected[key][0] - actual[key][0]) > 0.005
+        )
+        if rebuild and mismatches:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor.execute("DELETE FROM monthly_spending")
+            cursor.execute(
+                """
+                INSERT INTO monthly_spending (month, category_id, total, count)
+                SELECT substr(day, 1, 7), category_id, SUM(total), SUM(count)
+                FROM daily_spending GROUP BY substr(day, 1, 7), category_id
+                """
+            )
+            self.conn.commit()
+            logging.info(f"Rebuilt monthly spending rollup ({mismatches} mismatched entries).")
+        return mismatches
+
+    def _rollup_clause(self, start: str = None, end: str = None, category: str = None):
+        """Builds a WHERE clause over daily_spending for a date range and category."""
+        conditions, params = self._range_conditions("d.day", start, end)
+        if category:
+            conditions.append("d.category_id = ?")
+            params.append(self.category_id(category))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, tuple(params)
+
+    @_flush_first
+    @_replica_read
+    def get_daily_totals(self, start: str = None, end: str = None, category: str = None) -> list:
+        """Returns (day, total) pairs from the rollup, ordered by day."""
+        where, params = self._rollup_clause(start, end, category)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"SELECT d.day, SUM(d.total) FROM daily_spending d{where} GROUP BY d.day ORDER BY d.day",
+                params
+            )
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch daily totals: {e}")
+            raise
+
+    @_flush_first
+    @_replica_read
+    def get_period_totals(self, period: str = "month", start: str = None, end: str = None) -> list:
+        """
+        Returns (period, category, total, count) rows derived from the daily
+        rollup, where period is "month" (YYYY-MM) or "year" (YYYY).
+        """
+        width = {"month": 7, "year": 4}.get(period)
+        if width is None:
+            raise ValueError(f"Unknown period: {period}")
+        where, params = self._rollup_clause(start, end)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT substr(d.day, 1, {width}) AS period, c.name, SUM(d.total), SUM(d.count)
+                FROM daily_spending d JOIN categories c ON c.id = d.category_id{where}
+                GROUP BY period, d.category_id
+                ORDER BY period, c.name
+                """,
+                params
+            )
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch {period} totals: {e}")
+            raise
+
+    @_flush_first
+    @_replica_read
+    def get_spending_forecast(self, today: str = None) -> dict:
+        """
+        Projects month-end spending per category name as (spent so far,
+        projected total). The remaining days are charged at a blend of this
+        month's daily run rate and the recent daily rate scaled for the
+        season, weighted towards this month as it progresses. Reads only the
+        monthly rollup, a few dozen rows per category whatever the history.
+        """
+        day = datetime.strptime(today, "%Y-%m-%d").date() if today else _date.today()
+        month = _month_key(day.year, day.month)
+        days_in_month = calendar.monthrange(day.year, day.month)[1]
+        window = _month_key(day.year, day.month, -12 * FORECAST_SEASON_YEARS)
+        trailing = _month_key(day.year, day.month, -FORECAST_TRAILING_MONTHS)
+        try:
+            first = self.conn.execute("SELECT MIN(month) FROM monthly_spending").fetchone()[0]
+            if first is None:
+                return {}
+            rows = self.conn.execute(
+                """
+                SELECT c.name,
+                       TOTAL(CASE WHEN m.month = :month THEN m.total END),
+                       TOTAL(CASE WHEN m.month >= :trailing AND m.month < :month THEN m.total END),
+                       TOTAL(CASE WHEN substr(m.month, 6) = :mm AND m.month < :month THEN m.total END),
+                       TOTAL(CASE WHEN m.month < :month THEN m.total END)
+                FROM monthly_spending m JOIN categories c ON c.id = m.category_id
+                WHERE m.month >= :window AND m.month <= :month
+                GROUP BY m.category_id
+                """,
+                {"month": month, "trailing": trailing, "mm": month[5:], "window": window}
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to compute spending forecast: {e}")
+            raise
+
+        # How much history the windows really cover, for every category alike.
+        history_months = _months_between(max(window, first), month)
+        trailing_start = max(trailing, first)
+        trailing_days = (day.replace(day=1) - _date(int(trailing_start[:4]), int(trailing_start[5:]), 1)).days
+        same_month_years = sum(
+            1 for years_back in range(1, FORECAST_SEASON_YEARS + 1)
+            if _month_key(day.year - years_back, day.month) >= first
+        )
+        progress = day.day / days_in_month
+
+        forecast = {}
+        for name, spent, recent, same_month, history in rows:
+            current_rate = spent / day.day
+            base_rate = recent / trailing_days if trailing_days > 0 else current_rate
+            if same_month_years and history > 0:
+                base_rate *= (same_month / same_month_years) / (history / history_months)
+            rate = progress * current_rate + (1 - progress) * base_rate
+            forecast[name] = (round(spent, 2), round(spent + (days_in_month - day.day) * rate, 2))
+        return forecast
+
+    @_replica_read
+    def get_categories(self) -> list:
+        """Returns all category names in the order they were created."""
+        try:
+            self._check_category_cache()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, name FROM categories ORDER BY id")
+            rows = cursor.fetchall()
+            self._category_ids = {name.lower(): cat_id for cat_id, name in rows}
+            return [name for _, name in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch categories: {e}")
+            raise
+
+    def category_id(self, name: str, create: bool = False):
+        """
+        Returns the id of the category called ``name`` (case-insensitive), or
+        None if there is none. With ``create`` a missing category is added.
+        """
+        name = str(name).strip()
+        try:
+            self._check_category_cache()
+            cat_id = self._category_ids.get(name.lower())
+            if cat_id is not None:
+                return cat_id
+            row = self.conn.execute("SELECT id FROM categories WHERE name = ?", (name,)).fetchone()
+            if row is None and create and name:
+                row = (self._insert_category(name),)
+            if row is not None:
+                self._category_ids[name.lower()] = row[0]
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Failed to resolve category {name}: {e}")
+            raise
+
+    def _check_category_cache(self) -> None:
+        """
+        Forgets the cached category ids once another connection has
+        committed, since it may have renamed, deleted or re-added one.
+        """
+        version = (self.conn, self.conn.execute("PRAGMA data_version;").fetchone()[0])
+        if version != self._category_version:
+            self._category_ids = {}
+            self._category_version = version
+
+    @_retry_busy
+    def _insert_category(self, name: str) -> int:
+        with self.conn:
+            cat_id = self.conn.execute("INSERT INTO categories (name) VALUES (?)", (name,)).lastrowid
+        logging.info(f"Added category: {name}")
+        return cat_id
+
+    @_mirrored
+    def add_category(self, name: str) -> int:
+        """Adds a user-defined category and returns its id."""
+        name = str(name).strip()
+        if not name:
+            raise ValueError("Category name cannot be empty.")
+        if self.category_id(name) is not None:
+            raise ValueError(f"Category '{name}' already exists.")
+        return self.category_id(name, create=True)
+
+    @_mirrored
+    @_retry_busy
+    def rename_category(self, old_name: str, new_name: str) -> None:
+        """Renames a category; its expenses and budget follow automatically."""
+        new_name = str(new_name).strip()
+        cat_id = self.category_id(old_name)
+        if cat_id is None:
+            raise ValueError(f"Unknown category: {old_name}")
+        if not new_name:
+            raise ValueError("Category name cannot be empty.")
+        try:
+            with self.conn:
+                self.conn.execute("UPDATE categories SET name = ? WHERE id = ?", (new_name, cat_id))
+            self._category_ids = {}
+            logging.info(f"Renamed category {old_name} to {new_name}")
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Category '{new_name}' already exists.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to rename category {old_name}: {e}")
+            raise
+
+    @_mirrored
+    @_flush_first
+    @_retry_busy
+    def delete_category(self, name: str) -> None:
+        """Deletes a category that no expense (archived ones included), budget or rule refers to."""
+        cat_id = self.category_id(name)
+        if cat_id is None:
+            raise ValueError(f"Unknown category: {name}")
+        try:
+            # Archived expenses live in other files; the rollup still counts them.
+            if self.conn.execute("SELECT 1 FROM daily_spending WHERE category_id = ? LIMIT 1", (cat_id,)).fetchone():
+                raise sqlite3.IntegrityError("category has spending")
+            with self.conn:
+                self.conn.execute("DELETE FROM categories WHERE id = ?", (cat_id,))
+            self._category_ids.pop(str(name).strip().lower(), None)
+            logging.info(f"Deleted category: {name}")
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Category '{name}' is still in use.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete category {name}: {e}")
+            raise
+
+    @_mirrored
+    @_retry_busy
     def add_expense(self, date: str, amount: float, category: str, description: str, *, commit: bool = True) -> None:
-        """Inserts a new expense record into the expenses table."""
+        """
+        Inserts a new expense record into the expenses table. With write-behind
+        enabled, or when ``commit`` is False, the row is queued and committed
+        together with its neighbours (see flush). In-memory databases ignore
+        write-behind: the flush timer's connection couldn't reach them.
+        """
+        category_id = self.category_id(category, create=True)
+        in_memory = is_memory_database(self.db_name)
+        if (self.write_behind and not in_memory) or not commit:
+            with self._pending_lock:
+                self._pending.append((date, amount, category_id, description))
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+                if self._flush_timer is None and not in_memory:
+                    self._start_flush_timer(self.flush_interval)
+                if not self._flush_at_exit:
+                    # Queued inserts must reach disk even if the caller never closes us.
+                    atexit.register(self.flush)
+                    self._flush_at_exit = True
+            self.flush_if_due()
+            return
         try:
             with self.conn:  
                 cursor = self.conn.cursor()
-                cursor.execute(
-                    "INSERT INTO expenses (date, amount, category, description) VALUES (?,?,?,?)",
-                    (date, amount, category, description)
-                )
+                cursor.execute(INSERT_EXPENSE_SQL, (date, amount, category_id, description))
+                self._writes_since_analyze += 1
                 logging.info(f"Added expense: {date}, {amount}, {category}, {description}")
         except sqlite3.Error as e:
             logging.error(f"Failed to add expense: {e}")
             raise
 
+    @_mirrored
+    @_flush_first
+    @_retry_busy
     def delete_expense(self, record_id: int) -> None:
         """Deletes an expense record by its ID."""
         try:
             with self.conn:  
                 cursor = self.conn.cursor()
                 cursor.execute("DELETE FROM expenses WHERE id=?", (record_id,))
+                self._writes_since_analyze += cursor.rowcount
                 logging.info(f"Deleted expense with ID: {record_id}")
         except sqlite3.Error as e:
             logging.error(f"Failed to delete expense with ID {record_id}: {e}")
             raise
 
-    def get_all_expenses(self):
-        """Retrieves all expense records from the database."""
+    @_flush_first
+    @_replica_read
+    def get_all_expenses(self, include_archived: bool = False):
+        """
+        Retrieves all expense records from the database as Expense records.
+        Archived years are left out unless ``include_archived`` is set.
+        Prefer iter_expenses for passes over large tables.
+        """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT id, date, amount, category, description FROM expenses")
+            cursor.row_factory = Expense.row_factory
+            cursor.execute(SELECT_EXPENSES_SQL)
             rows = cursor.fetchall()
+            if include_archived:
+                for year in self.get_archived_years():
+                    rows.extend(self._read_archive(year, SELECT_ARCHIVE_SQL, row_factory=Expense.row_factory))
+                rows.sort(key=lambda r: r.id)
             logging.info("Fetched all expenses.")
             return rows
         except sqlite3.Error as e:
             logging.error(f"Failed to fetch all expenses: {e}")
             raise
 
+    @_flush_first
+    @_replica_read
     def expense_exists(self, date: str, amount: float, category: str, description: str) -> bool:
         """Checks if an expense with the given details already exists in the database."""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """
-                SELECT 1 FROM expenses
-                WHERE date=? AND amount=? AND category=? AND description=?
-                LIMIT 1
-                """,
-                (date, round(amount, 2), category, description)
-            )
-            exists = cursor.fetchone() is not None
+            exists = self.get_expense_id(date, amount, category, description) is not None
             logging.info(f"Expense exists check for {date}, {amount}, {category}, {description}: {exists}")
             return exists
         except sqlite3.Error as e:
             logging.error(f"Failed to check if expense exists: {e}")
             raise
 
+    @_flush_first
+    @_replica_read
     def get_expense_id(self, date: str, amount: float, category: str, description: str):
-        """Retrieves the ID of an expense based on its unique fields."""
+        """Retrieves the ID of an expense by probing its content hash."""
         try:
             amount = float(amount)
         except ValueError:
@@ -134,14 +1527,13 @@ class DatabaseManager:
             raise ValueError(f"Invalid amount value: {amount}")
 
         try:
+            category_id = self.category_id(category)
+            if category_id is None:
+                return None
             cursor = self.conn.cursor()
             cursor.execute(
-                """
-                SELECT id FROM expenses
-                WHERE date=? AND amount=? AND category=? AND description=?
-                LIMIT 1
-                """,
-                (date, round(amount, 2), category, description)
+                "SELECT id FROM expenses WHERE content_hash = ? LIMIT 1",
+                (expense_hash(date, amount, category_id, description),)
             )
             result = cursor.fetchone()
             return result[0] if result else None
@@ -149,27 +1541,381 @@ class DatabaseManager:
             logging.error(f"Failed to retrieve expense ID: {e}")
             raise
 
+    @_mirrored
+    @_retry_busy
+    def flush(self) -> int:
+        """Commits every queued write-behind insert in one transaction; returns the row count."""
+        with self._pending_lock:
+            if not self._pending:
+                return 0
+            rows, self._pending, self._pending_since = self._pending, [], None
+            try:
+                self._insert_bulk(rows)
+            except sqlite3.Error:
+                # Keep the rows queued so a later flush can retry them.
+                self._pending = rows + self._pending
+                self._pending_since = time.monotonic()
+                raise
+            return len(rows)
+
+    def _start_flush_timer(self, delay: float) -> None:
+        self._flush_timer = threading.Timer(delay, self._flush_overdue)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def _flush_overdue(self) -> None:
+        """
+        Runs on the flush timer, so a queued row is committed within
+        flush_interval even when no further call arrives. The connection
+        belongs to the caller's thread, so the rows go through one of the
+        timer's own; the rollups follow through the triggers as usual.
+        """
+        with self._pending_lock:
+            self._flush_timer = None
+            if not self._pending:
+                return
+            waited = time.monotonic() - self._pending_since
+            if waited < self.flush_interval:
+                # Flushed meanwhile and queued again: wait for the new rows.
+                self._start_flush_timer(self.flush_interval - waited)
+                return
+            rows, self._pending, self._pending_since = self._pending, [], None
+            try:
+                conn = sqlite3.connect(self.db_name, uri=True, timeout=self.busy_timeout)
+                try:
+                    self._register_functions(conn)
+                    conn.execute("BEGIN IMMEDIATE;")
+                    conn.executemany(INSERT_EXPENSE_SQL, rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+                self._writes_since_analyze += len(rows)
+                logging.info(f"Flushed {len(rows)} queued expenses after {waited:.2f}s.")
+            except sqlite3.Error as e:
+                self._pending = rows + self._pending
+                self._pending_since = time.monotonic()
+                self._start_flush_timer(self.flush_interval)
+                logging.error(f"Failed to flush queued expenses: {e}")
+
+    def _stop_flush_timer(self) -> None:
+        timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def flush_if_due(self) -> int:
+        """Flushes the write-behind queue once it is full or old enough."""
+        if not self._pending:
+            return 0
+        if (len(self._pending) >= self.flush_rows
+                or time.monotonic() - self._pending_since >= self.flush_interval):
+            return self.flush()
+        return 0
+
+    @_mirrored
+    @_flush_first
+    @_retry_busy
     def add_expenses_bulk(self, expenses: list) -> None:
-        """Bulk inserts expenses into the database."""
+        """Bulk inserts (date, amount, category name, description) rows into the database."""
+        ids = {name: self.category_id(name, create=True) for name in {row[2] for row in expenses}}
+        self._insert_bulk([(date, amount, ids[cat], desc) for date, amount, cat, desc in expenses])
+
+    def _insert_bulk(self, expenses: list) -> None:
+        """Inserts (date, amount, category_id, description) rows in one transaction."""
         try:
             cursor = self.conn.cursor()
-            self.conn.execute("BEGIN TRANSACTION;")
-            cursor.executemany(
-                "INSERT INTO expenses (date, amount, category, description) VALUES (?, ?, ?, ?)",
-                expenses
-            )
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor.executemany(INSERT_EXPENSE_SQL, expenses)
             self.conn.commit()
+            self._writes_since_analyze += len(expenses)
             logging.info(f"Bulk inserted {len(expenses)} expenses.")
         except sqlite3.Error as e:
             self.conn.rollback()
             logging.error(f"Failed to bulk insert expenses: {e}")
             raise
 
+    @_mirrored
+    @_flush_first
+    @_retry_busy
+    def add_statement_rows(self, rows: list) -> int:
+        """
+        Inserts (date, amount, category name, description, fitid[, occurrence])
+        rows from a bank statement in one transaction, skipping transactions
+        already imported, and returns how many were new. ``occurrence``
+        (default 1) numbers identical rows without a FITID within a statement;
+        see IMPORT_EXPENSE_SQL.
+        """
+        ids = {name: self.category_id(name, create=True) for name in {row[2] for row in rows}}
+        params = [
+            (date, amount, ids[cat], desc, fitid, occurrence[0] if occurrence else 1)
+            for date, amount, cat, desc, fitid, *occurrence in rows
+        ]
+        params = self._skip_archived_imports(params)
+        try:
+            cursor = self.conn.cursor()
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor.executemany(IMPORT_EXPENSE_SQL, params)
+            count = cursor.rowcount
+            self.conn.commit()
+            self._writes_since_analyze += count
+            logging.info(f"Imported {count} of {len(rows)} statement transactions.")
+            return count
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            logging.error(f"Failed to import statement transactions: {e}")
+            raise
+
+    def _skip_archived_imports(self, params: list) -> list:
+        """
+        Takes statement rows dated in archived years and already in their
+        archive out of ``params``, since IMPORT_EXPENSE_SQL only sees live
+        expenses: a FITID found there is a duplicate, and a row without one
+        counts the archived copies against its occurrence number.
+        """
+        archived = set(self.get_archived_years())
+        by_year = {}
+        for i, row in enumerate(params):
+            if int(row[0][:4]) in archived:
+                by_year.setdefault(int(row[0][:4]), []).append(i)
+        if not by_year:
+            return params
+
+        params = list(params)
+        for year, indexes in by_year.items():
+            rows = [params[i] for i in indexes]
+            hashes = {expense_hash(*row[:4]) for row in rows if row[4] is None}
+            fitids = {row[4] for row in rows if row[4] is not None}
+            found = self._read_archive(
+                year,
+                "SELECT content_hash, fitid FROM {db}.expenses "
+                f"WHERE content_hash IN ({', '.join('?' * len(hashes))}) "
+                f"OR fitid IN ({', '.join('?' * len(fitids))})",
+                (*hashes, *fitids)
+            )
+            archived_fitids = {fitid for _, fitid in found if fitid is not None}
+            counts = {}
+            for content_hash, _ in found:
+                counts[content_hash] = counts.get(content_hash, 0) + 1
+            for i, row in zip(indexes, rows):
+                if row[4] is not None:
+                    params[i] = None if row[4] in archived_fitids else row
+                else:
+                    occurrence = row[5] - counts.get(expense_hash(*row[:4]), 0)
+                    params[i] = row[:5] + (occurrence,) if occurrence > 0 else None
+        return [row for row in params if row is not None]
+
+    @_replica_read
+    def get_payee_rules(self) -> list:
+        """Returns (pattern, category name, priority) for every payee rule, highest priority first."""
+        try:
+            return self.conn.execute(
+                """
+                SELECT r.pattern, c.name, r.priority
+                FROM payee_rules r JOIN categories c ON c.id = r.category_id
+                ORDER BY r.priority DESC, length(r.pattern) DESC, r.pattern
+                """
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch payee rules: {e}")
+            raise
+
+    @_mirrored
+    @_retry_busy
+    def set_payee_rule(self, pattern: str, category: str, priority: int = 0) -> None:
+        """Adds or replaces the rule sending payees containing ``pattern`` to ``category``."""
+        pattern = str(pattern).strip()
+        if not pattern:
+            raise ValueError("Payee pattern cannot be empty.")
+        try:
+            with self.conn:
+                self.conn.execute(
+                    """
+                    INSERT INTO payee_rules (pattern, category_id, priority) VALUES (?, ?, ?)
+                    ON CONFLICT(pattern) DO UPDATE
+                    SET category_id = excluded.category_id, priority = excluded.priority
+                    """,
+                    (pattern, self.category_id(category, create=True), priority)
+                )
+            logging.info(f"Set payee rule: {pattern} -> {category}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to set payee rule {pattern}: {e}")
+            raise
+
+    @_mirrored
+    @_retry_busy
+    def delete_payee_rule(self, pattern: str) -> None:
+        """Deletes the payee rule for ``pattern``."""
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM payee_rules WHERE pattern = ?", (str(pattern).strip(),))
+            logging.info(f"Deleted payee rule: {pattern}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete payee rule {pattern}: {e}")
+            raise
+
+    @_replica_read
+    def get_recurring_rules(self) -> list:
+        """
+        Returns (id, description, amount, category name, start date, end date,
+        interval unit, interval count, materialized through) for every rule.
+        """
+        try:
+            return self.conn.execute(
+                """
+                SELECT r.id, r.description, r.amount, c.name, r.start_date, r.end_date,
+                       r.interval_unit, r.interval_count, r.materialized_through
+                FROM recurring_rules r JOIN categories c ON c.id = r.category_id
+                ORDER BY r.start_date, r.id
+                """
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch recurring rules: {e}")
+            raise
+
+    @_mirrored
+    @_retry_busy
+    def add_recurring_rule(self, description: str, amount: float, category: str, start_date: str,
+                           interval_unit: str = "month", interval_count: int = 1, end_date: str = None) -> int:
+        """
+        Adds an expense repeating every ``interval_count`` ``interval_unit``s
+        from ``start_date`` (through ``end_date``, if given) and returns its
+        id. Occurrences are generated by materialize_recurring.
+        """
+        if interval_unit not in RECURRENCE_UNITS:
+            raise ValueError(f"Unknown interval unit: {interval_unit}")
+        if int(interval_count) < 1:
+            raise ValueError("Interval must be at least 1.")
+        if end_date and end_date < start_date:
+            raise ValueError("End date must not be before the start date.")
+        try:
+            with self.conn:
+                rule_id = self.conn.execute(
+                    """
+                    INSERT INTO recurring_rules
+                        (description, amount, category_id, start_date, end_date, interval_unit, interval_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (description, amount, self.category_id(category, create=True), start_date,
+                     end_date or None, interval_unit, int(interval_count))
+                ).lastrowid
+            logging.info(f"Added recurring rule {rule_id}: {description}, every {interval_count} {interval_unit}")
+            return rule_id
+        except sqlite3.Error as e:
+            logging.error(f"Failed to add recurring rule {description}: {e}")
+            raise
+
+    @_mirrored
+    @_retry_busy
+    def delete_recurring_rule(self, rule_id: int) -> None:
+        """Stops a recurring rule; expenses it already generated are kept."""
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,))
+            logging.info(f"Deleted recurring rule {rule_id}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete recurring rule {rule_id}: {e}")
+            raise
+
+    @_mirrored
+    @_flush_first
+    @_retry_busy
+    def materialize_recurring(self, today: str = None) -> int:
+        """
+        Generates every occurrence of every rule due up to ``today`` (default:
+        the current date) that lies after the rule's watermark, in a single
+        recursive INSERT ... SELECT, and returns how many expenses were added.
+        Occurrences already present are skipped by the (rule, date) unique
+        index; ones the user deleted stay deleted, being behind the watermark.
+        Monthly and yearly rules keep their day of month, clamped to the
+        month's last day (Jan 31 -> Feb 28 -> Mar 31).
+        """
+        today = today or _date.today().isoformat()
+        due = "r.start_date <= :today AND (r.materialized_through IS NULL OR r.materialized_through < :today)"
+        months = "r.interval_count * (CASE r.interval_unit WHEN 'year' THEN 12 ELSE 1 END)"
+
+        # The n-th occurrence is computed from the start date, so month-end
+        # clamping never drifts.
+        def nth(n):
+            return f"""
+                CASE r.interval_unit
+                    WHEN 'day' THEN date(r.start_date, printf('%+d days', ({n}) * r.interval_count))
+                    WHEN 'week' THEN date(r.start_date, printf('%+d days', 7 * ({n}) * r.interval_count))
+                    ELSE min(
+                        date(r.start_date, 'start of month', printf('%+d months', ({n}) * {months}),
+                             printf('%+d days', CAST(strftime('%d', r.start_date) AS INTEGER) - 1)),
+                        date(r.start_date, 'start of month', printf('%+d months', ({n}) * {months} + 1), '-1 day'))
+                END
+            """
+        # Index of the last occurrence on or before the watermark (give or
+        # take month-end clamping), so each run starts there instead of
+        # regenerating the rule's whole history.
+        first = f"""
+            CASE WHEN r.materialized_through IS NULL OR r.materialized_through < r.start_date THEN 0
+            ELSE CASE r.interval_unit
+                WHEN 'day' THEN CAST((julianday(r.materialized_through) - julianday(r.start_date))
+                                     / r.interval_count AS INTEGER)
+                WHEN 'week' THEN CAST((julianday(r.materialized_through) - julianday(r.start_date))
+                                      / (7 * r.interval_count) AS INTEGER)
+                ELSE ((CAST(strftime('%Y', r.materialized_through) AS INTEGER)
+                       - CAST(strftime('%Y', r.start_date) AS INTEGER)) * 12
+                      + CAST(strftime('%m', r.materialized_through) AS INTEGER)
+                      - CAST(strftime('%m', r.start_date) AS INTEGER)) / ({months})
+            END END
+        """
+        limit = "min(:today, coalesce(r.end_date, :today))"
+        try:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                INSERT OR IGNORE INTO expenses
+                    (date, amount, category_id, description, content_hash, recurring_rule_id)
+                WITH RECURSIVE seeds(rule_id, n) AS (
+                    SELECT r.id, {first} FROM recurring_rules r WHERE {due}
+                ),
+                occurrences(rule_id, n, day) AS (
+                    SELECT s.rule_id, s.n, {nth("s.n")}
+                    FROM seeds s JOIN recurring_rules r ON r.id = s.rule_id
+                    UNION ALL
+                    SELECT o.rule_id, o.n + 1, {nth("o.n + 1")}
+                    FROM occurrences o JOIN recurring_rules r ON r.id = o.rule_id
+                    WHERE o.day <= {limit}
+                )
+                SELECT o.day, r.amount, r.category_id, r.description,
+                       expense_hash(o.day, r.amount, r.category_id, r.description), r.id
+                FROM occurrences o JOIN recurring_rules r ON r.id = o.rule_id
+                WHERE o.day <= {limit} AND o.day > coalesce(r.materialized_through, '')
+                """,
+                {"today": today}
+            )
+            count = cursor.rowcount
+            cursor.execute(
+                """
+                UPDATE recurring_rules SET materialized_through = :today
+                WHERE start_date <= :today AND (materialized_through IS NULL OR materialized_through < :today)
+                """,
+                {"today": today}
+            )
+            self.conn.commit()
+            self._writes_since_analyze += count
+            if count:
+                logging.info(f"Materialized {count} recurring expenses through {today}.")
+            return count
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            logging.error(f"Failed to materialize recurring expenses: {e}")
+            raise
+
+    @_replica_read
     def get_all_budgets(self):
-        """Fetch all budget records from the database."""
+        """Fetch all budget records from the database as Budget records."""
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT category, budget, spent FROM budgets")
+            cursor.row_factory = Budget.row_factory
+            cursor.execute(
+                "SELECT c.name, b.budget, b.spent FROM budgets b JOIN categories c ON c.id = b.category_id"
+            )
             result = cursor.fetchall()
             logging.info("Fetched all budgets.")
             return result
@@ -177,6 +1923,8 @@ class DatabaseManager:
             logging.error(f"Failed to fetch all budgets: {e}")
             raise
 
+    @_mirrored
+    @_retry_busy
     def add_or_update_budget(self, category: str, budget: float) -> None:
         """Insert or update a budget record."""
         try:
@@ -184,17 +1932,19 @@ class DatabaseManager:
                 cursor = self.conn.cursor()
                 cursor.execute(
                     """
-                    INSERT INTO budgets (category, budget)
+                    INSERT INTO budgets (category_id, budget)
                     VALUES (?, ?)
-                    ON CONFLICT(category) DO UPDATE SET budget=excluded.budget
+                    ON CONFLICT(category_id) DO UPDATE SET budget=excluded.budget
                     """,
-                    (category, budget)
+                    (self.category_id(category, create=True), budget)
                 )
                 logging.info(f"Added or updated budget for category: {category}, budget: {budget}")
         except sqlite3.Error as e:
             logging.error(f"Failed to add or update budget for category {category}: {e}")
             raise
 
+    @_mirrored
+    @_retry_busy
     def update_spent(self, category: str, amount: float) -> None:
         """Updates the spent amount for a specific category."""
         try:
@@ -204,26 +1954,29 @@ class DatabaseManager:
                     """
                     UPDATE budgets
                     SET spent = spent + ?
-                    WHERE category = ?
+                    WHERE category_id = ?
                     """,
-                    (amount, category)
+                    (amount, self.category_id(category))
                 )
                 logging.info(f"Updated spent amount for category: {category}, amount: {amount}")
         except sqlite3.Error as e:
             logging.error(f"Failed to update spent amount for category {category}: {e}")
             raise
 
+    @_mirrored
+    @_retry_busy
     def delete_budget(self, category: str) -> None:
         """Delete a budget record by category."""
         try:
             with self.conn: 
                 cursor = self.conn.cursor()
-                cursor.execute("DELETE FROM budgets WHERE category=?", (category,))
+                cursor.execute("DELETE FROM budgets WHERE category_id=?", (self.category_id(category),))
                 logging.info(f"Deleted budget for category: {category}")
         except sqlite3.Error as e:
             logging.error(f"Failed to delete budget for category {category}: {e}")
             raise
 
+    @_replica_read
     def get_remaining_budget(self) -> float:
         """Returns the remaining budget (total budget - total spent)."""
         try:
@@ -236,9 +1989,852 @@ class DatabaseManager:
             logging.error(f"Failed to fetch remaining budget: {e}")
             raise
 
+    def archive_path(self, year: int) -> str:
+        """Returns the path of the archive database holding the given year."""
+        base = Path(os.path.abspath(self.db_name))
+        return str(base.parent / "archive" / f"{base.stem}_{year}.db")
+
+    @_replica_read
+    def get_archived_years(self) -> list:
+        """Returns the years that have been moved out to archive databases."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT year FROM archived_years ORDER BY year")
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch archived years: {e}")
+            raise
+
+    @_refreshes_replica
+    @_flush_first
+    def archive_closed_years(self, before_year: int = None) -> dict:
+        """
+        Moves every expense dated before ``before_year`` (default: the current
+        year) into per-year archive databases; the rollups keep counting them.
+        Returns a mapping of year -> number of rows moved.
+        """
+        if before_year is None:
+            before_year = _date.today().year
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) FROM expenses
+                WHERE date < ? ORDER BY 1
+                """,
+                (f"{before_year:04d}-01-01",)
+            )
+            years = [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to find closed years to archive: {e}")
+            raise
+
+        moved = {}
+        for i in range(0, len(years), MAX_ATTACHED):
+            moved.update(self._archive_years(years[i:i + MAX_ATTACHED]))
+        logging.info(f"Archived closed years: {moved}")
+        return moved
+
+    def _archive_years(self, years: list) -> dict:
+        """
+        Moves the given years into their archive files in two steps. SQLite
+        doesn't make a transaction spanning attached databases atomic in WAL
+        mode, so the rows are first copied into the archives and committed
+        there, and only once every copy is confirmed are they deleted from
+        the main database in a transaction of its own. A copy interrupted
+        halfway is simply repeated by the next run.
+        """
+        attached, moved = [], {}
+        try:
+            for year in years:
+                path = self.archive_path(year)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.conn.execute(f"ATTACH DATABASE ? AS archive_{year}", (path,))
+                attached.append(year)
+
+            cursor = self.conn.cursor()
+            self.conn.execute("BEGIN IMMEDIATE;")
+            for year in years:
+                alias = f"archive_{year}"
+                cursor.execute(ARCHIVE_EXPENSES_SQL.format(table=f"{alias}.expenses"))
+                cursor.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {alias}.expenses ({ARCHIVE_COLUMNS})
+                    SELECT {ARCHIVE_COLUMNS} FROM main.expenses WHERE date >= ? AND date < ?
+                    """,
+                    (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+                )
+            self.conn.commit()
+
+            for year in years:
+                expected, copied = cursor.execute(
+                    f"""
+                    SELECT COUNT(*), COUNT(a.id) FROM main.expenses e
+                    LEFT JOIN archive_{year}.expenses a ON a.id = e.id
+                    WHERE e.date >= ? AND e.date < ?
+                    """,
+                    (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+                ).fetchone()
+                if copied != expected:
+                    raise sqlite3.IntegrityError(
+                        f"archive for {year} holds {copied} of its {expected} expenses"
+                    )
+
+            # Only rows present in the archive are deleted, so an expense
+            # added for the year since the copy stays until the next run.
+            self.conn.execute("BEGIN IMMEDIATE;")
+            for year in years:
+                alias = f"archive_{year}"
+                span = (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+                archived = f"date >= ? AND date < ? AND id IN (SELECT id FROM {alias}.expenses)"
+                # The delete trigger takes archived days out of the rollup;
+                # put them back so summaries keep covering the whole history.
+                cursor.execute(
+                    f"""
+                    SELECT date, category_id, SUM(amount), COUNT(*) FROM main.expenses
+                    WHERE {archived} GROUP BY date, category_id
+                    """,
+                    span
+                )
+                rollup = cursor.fetchall()
+                cursor.execute(f"DELETE FROM main.expenses WHERE {archived}", span)
+                moved[year] = cursor.rowcount
+                cursor.executemany(
+                    """
+                    INSERT INTO main.daily_spending (day, category_id, total, count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(day, category_id) DO UPDATE
+                    SET total = total + excluded.total, count = count + excluded.count
+                    """,
+                    rollup
+                )
+                cursor.execute(
+                    "INSERT OR REPLACE INTO main.archived_years (year, archived_at) VALUES (?, datetime('now'))",
+                    (year,)
+                )
+            self.conn.commit()
+            self._writes_since_analyze += 2 * sum(moved.values())
+            return moved
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logging.error(f"Failed to archive years {years}: {e}")
+            raise
+        finally:
+            for year in attached:
+                self.conn.execute(f"DETACH DATABASE archive_{year}")
+
+    def _archive_available(self, year: int) -> bool:
+        """
+        False, with a warning, when the archive file for an archived year is
+        missing (say, a database restored without it); its rows are skipped
+        while the rollups still count them.
+        """
+        if os.path.exists(self.archive_path(year)):
+            return True
+        logging.warning(f"Archive for {year} not found, leaving its expenses out: {self.archive_path(year)}")
+        return False
+
+    def _read_archive(self, year: int, sql: str, params: tuple = (), row_factory=None) -> list:
+        """
+        Attaches the archive for ``year`` read-only, runs ``sql`` against it
+        (``{db}`` is replaced by the schema alias, ``{live}`` by main) and
+        detaches it again.
+        """
+        if not self._archive_available(year):
+            return []
+        alias = f"archive_{year}"
+        uri = Path(self.archive_path(year)).as_uri() + "?mode=ro"
+        self.conn.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+        try:
+            cursor = self.conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(sql.format(db=alias, live="main"), params).fetchall()
+        finally:
+            self.conn.execute(f"DETACH DATABASE {alias}")
+
+    def _archived_years_between(self, start: str = None, end: str = None) -> list:
+        """Returns the archived years overlapping the inclusive date range."""
+        first = int(start[:4]) if start else 0
+        last = int(end[:4]) if end else 9999
+        return [year for year in self.get_archived_years() if first <= year <= last]
+
+    @staticmethod
+    def _range_conditions(column: str, start: str = None, end: str = None):
+        """Returns SQL conditions and parameters for an inclusive range on ``column``."""
+        if start and end:
+            return [f"{column} BETWEEN ? AND ?"], [start, end]
+        if start:
+            return [f"{column} >= ?"], [start]
+        if end:
+            return [f"{column} <= ?"], [end]
+        return [], []
+
+    @classmethod
+    def _date_range_clause(cls, start: str = None, end: str = None):
+        """Builds a WHERE clause restricting ``date`` to the inclusive range."""
+        conditions, params = cls._range_conditions("date", start, end)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, tuple(params)
+
+    @_flush_first
+    @_replica_read
+    def get_expenses_between(self, start: str = None, end: str = None, category: str = None):
+        """
+        Retrieves expenses dated within the inclusive range, optionally for a
+        single category, ordered by date. Archives are only attached for the
+        years the range touches.
+        """
+        where, params = self._date_range_clause(start, end)
+        hot_where, hot_params = where, params
+        archive_where, archive_params = where, params
+        if category:
+            category_id = self.category_id(category)
+            if category_id is None:
+                return []
+            joiner = " AND " if where else " WHERE "
+            hot_where, hot_params = f"{where}{joiner}e.category_id = ?", params + (category_id,)
+            archive_where, archive_params = f"{where}{joiner}a.category_id = ?", params + (category_id,)
+        try:
+            cursor = self.conn.cursor()
+            cursor.row_factory = Expense.row_factory
+            cursor.execute(
+                SELECT_EXPENSES_SQL + hot_where,
+                hot_params
+            )
+            rows = cursor.fetchall()
+            for year in self._archived_years_between(start, end):
+                rows.extend(self._read_archive(
+                    year,
+                    SELECT_ARCHIVE_SQL + archive_where,
+                    archive_params,
+                    row_factory=Expense.row_factory
+                ))
+            rows.sort(key=lambda r: (r.date, r.id))
+            logging.info(f"Fetched expenses between {start} and {end}.")
+            return rows
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch expenses between {start} and {end}: {e}")
+            raise
+
+    def _filter_clause(self, flt: ExpenseFilter, archive: bool = False):
+        """
+        Builds the WHERE clause for ``flt`` against the live table (aliases e
+        and c) or an archive table, or returns None when nothing can match.
+        """
+        conditions, params = self._range_conditions("date", flt.start, flt.end)
+        if flt.category:
+            category_id = self.category_id(flt.category)
+            if category_id is None:
+                return None
+            conditions.append("a.category_id = ?" if archive else "e.category_id = ?")
+            params.append(category_id)
+        if flt.search:
+            escaped = flt.search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            table = "a" if archive else "e"
+            columns = (f"{table}.date", f"CAST({table}.amount AS TEXT)", "c.name", f"{table}.description")
+            conditions.append("(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in columns) + ")")
+            params.extend([f"%{escaped}%"] * len(columns))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, tuple(params)
+
+    @staticmethod
+    def _fetch_batches(cursor, batch_size: int):
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    @_flush_first
+    @_replica_read
+    def iter_expenses(self, filter=None, batch_size: int = ITER_BATCH_SIZE):
+        """
+        Yields Expense records matching ``filter`` (an ExpenseFilter or a dict
+        of its fields) in date order, fetching ``batch_size`` rows at a time so
+        a full pass never holds more than one batch. With include_archived the
+        archived years the range touches come first, then the live table.
+        """
+        flt = ExpenseFilter.coerce(filter)
+        try:
+            if flt.include_archived:
+                for year in self._archived_years_between(flt.start, flt.end):
+                    yield from self._iter_archive(year, flt, batch_size)
+            clause = self._filter_clause(flt)
+            if clause is None:
+                return
+            where, params = clause
+            cursor = self.conn.cursor()
+            cursor.row_factory = Expense.row_factory
+            cursor.execute(SELECT_EXPENSES_SQL + where + " ORDER BY e.date, e.id", params)
+            yield from self._fetch_batches(cursor, batch_size)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to stream expenses: {e}")
+            raise
+
+    def _iter_archive(self, year: int, flt: ExpenseFilter, batch_size: int):
+        """
+        Streams one archive through its own read-only connection, with the
+        live database attached for category names, so the main connection
+        isn't left with an attached database while the caller consumes rows.
+        """
+        if not self._archive_available(year):
+            return
+        clause = self._filter_clause(flt, archive=True)
+        if clause is None:
+            return
+        where, params = clause
+        uri = Path(self.archive_path(year)).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            conn.execute("ATTACH DATABASE ? AS live", (Path(os.path.abspath(self.db_name)).as_uri() + "?mode=ro",))
+            cursor = conn.cursor()
+            cursor.row_factory = Expense.row_factory
+            cursor.execute(
+                SELECT_ARCHIVE_SQL.format(db="main", live="live") + where + " ORDER BY a.date, a.id",
+                params
+            )
+            yield from self._fetch_batches(cursor, batch_size)
+        finally:
+            conn.close()
+
+    def get_expenses(self, filter=None) -> list:
+        """Materialized iter_expenses, for callers (and the service) that need a list."""
+        return list(self.iter_expenses(filter))
+
+    @_flush_first
+    @_retry_busy
+    def _bulk_apply(self, operation: str, filter, sql: str, params: tuple = (), dry_run: bool = False) -> int:
+        """
+        Runs one set-based statement over the live expenses matching
+        ``filter`` and returns how many rows it touched (or would touch, with
+        ``dry_run``). The rows are first copied to undo_snapshot, replacing
+        the previous snapshot, and ``sql`` targets them through ``{ids}``.
+        Archived years are never changed.
+        """
+        clause = self._filter_clause(ExpenseFilter.coerce(filter))
+        if clause is None:
+            return 0
+        where, where_params = clause
+        selection = f"SELECT e.id FROM expenses e JOIN categories c ON c.id = e.category_id{where}"
+        try:
+            if dry_run:
+                return self.conn.execute(f"SELECT COUNT(*) FROM ({selection})", where_params).fetchone()[0]
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM undo_snapshot")
+            cursor.execute(
+                f"""
+                INSERT INTO undo_snapshot (id, date, amount, category_id, description, content_hash, fitid,
+                                           recurring_rule_id, operation)
+                SELECT id, date, amount, category_id, description, content_hash, fitid, recurring_rule_id, ?
+                FROM expenses WHERE id IN ({selection})
+                """,
+                (operation,) + where_params
+            )
+            cursor.execute(sql.format(ids="SELECT id FROM undo_snapshot"), params)
+            count = cursor.rowcount
+            self.conn.commit()
+            self._writes_since_analyze += count
+            logging.info(f"Bulk {operation} touched {count} expenses.")
+            return count
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            logging.error(f"Failed to run bulk {operation}: {e}")
+            raise
+
+    @_mirrored
+    def bulk_delete(self, filter, dry_run: bool = False) -> int:
+        """Deletes every live expense matching ``filter``; see _bulk_apply."""
+        return self._bulk_apply("delete", filter, "DELETE FROM expenses WHERE id IN ({ids})", dry_run=dry_run)
+
+    @_mirrored
+    def bulk_recategorize(self, filter, category: str, dry_run: bool = False) -> int:
+        """Moves every live expense matching ``filter`` to ``category``."""
+        category_id = self.category_id(category, create=not dry_run)
+        if category_id is None and not dry_run:
+            raise ValueError("Category name cannot be empty.")
+        return self._bulk_apply(
+            "recategorize", filter,
+            """
+            UPDATE expenses
+            SET category_id = ?1, content_hash = expense_hash(date, amount, ?1, description)
+            WHERE id IN ({ids})
+            """,
+            (category_id,), dry_run
+        )
+
+    @_mirrored
+    def bulk_scale(self, filter, factor: float, dry_run: bool = False) -> int:
+        """Multiplies the amount of every live expense matching ``filter`` by ``factor``."""
+        factor = float(factor)
+        if factor <= 0:
+            raise ValueError("Scale factor must be positive.")
+        return self._bulk_apply(
+            "scale", filter,
+            """
+            UPDATE expenses
+            SET amount = round(amount * ?1, 2),
+                content_hash = expense_hash(date, round(amount * ?1, 2), category_id, description)
+            WHERE id IN ({ids})
+            """,
+            (factor,), dry_run
+        )
+
+    @_replica_read
+    def get_undo_info(self):
+        """Returns (operation, row count) for the undoable bulk operation, or None."""
+        try:
+            row = self.conn.execute(
+                "SELECT operation, COUNT(*) FROM undo_snapshot GROUP BY operation"
+            ).fetchone()
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Failed to read undo snapshot: {e}")
+            raise
+
+    @_mirrored
+    @_flush_first
+    @_retry_busy
+    def undo_bulk(self) -> int:
+        """
+        Puts the rows touched by the last bulk operation back as they were
+        before it ran, and returns how many were restored.
+        """
+        try:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM expenses WHERE id IN (SELECT id FROM undo_snapshot)")
+            cursor.execute(
+                """
+                INSERT INTO expenses (id, date, amount, category_id, description, content_hash, fitid,
+                                      recurring_rule_id)
+                SELECT id, date, amount, category_id, description, content_hash, fitid, recurring_rule_id
+                FROM undo_snapshot
+                """
+            )
+            count = cursor.rowcount
+            cursor.execute("DELETE FROM undo_snapshot")
+            self.conn.commit()
+            self._writes_since_analyze += 2 * count
+            logging.info(f"Undid bulk operation on {count} expenses.")
+            return count
+        except sqlite3.IntegrityError as e:
+            self.conn.rollback()
+            logging.error(f"Failed to undo bulk operation: {e}")
+            raise ValueError("Cannot undo: a category used by these expenses was deleted.") from e
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            logging.error(f"Failed to undo bulk operation: {e}")
+            raise
+
+    @_flush_first
+    @_replica_read
+    def get_category_totals(self, start: str = None, end: str = None) -> dict:
+        """
+        Returns total spending per category name within the inclusive date
+        range, read from the daily rollup so archived years cost nothing extra.
+        """
+        where, params = self._rollup_clause(start, end)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT c.name, t.total
+                FROM (SELECT d.category_id, SUM(d.total) AS total FROM daily_spending d{where}
+                      GROUP BY d.category_id) t
+                JOIN categories c ON c.id = t.category_id
+                """,
+                params
+            )
+            totals = {name: total or 0.0 for name, total in cursor.fetchall()}
+            logging.info(f"Fetched category totals between {start} and {end}.")
+            return totals
+        except sqlite3.Error as e:
+            logging.error(f"Failed to fetch category totals: {e}")
+            raise
+
+    @_flush_first
+    def backup(self, dest_path: str, *, compress: bool = False,
+               pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP,
+               progress=None) -> str:
+        """
+        Writes a consistent snapshot of the database to ``dest_path`` using the
+        SQLite online backup API. The copy runs on its own connection in steps
+        of ``pages`` pages with a pause between steps, so it is safe to call
+        from a worker thread while the UI keeps reading and writing. The
+        archives of archived years are copied into the snapshot as well.
+        Returns the path of the written file (``.gz`` appended when compressed).
+        """
+        if compress and not dest_path.endswith(".gz"):
+            dest_path += ".gz"
+        dest_dir = os.path.dirname(os.path.abspath(dest_path))
+        os.makedirs(dest_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=dest_dir)
+        os.close(fd)
+
+        def on_step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining and sleep:
+                time.sleep(sleep)
+
+        try:
+            source = sqlite3.connect(self.db_name, uri=True, timeout=self.busy_timeout)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target, pages=pages, progress=on_step)
+                self._embed_archives(target)
+            finally:
+                target.close()
+                source.close()
+            if compress:
+                with open(tmp_path, "rb") as src, gzip.open(dest_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                os.replace(tmp_path, dest_path)
+            logging.info(f"Backed up {self.db_name} to {dest_path}")
+            return dest_path
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Failed to back up database to {dest_path}: {e}")
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _embed_archives(self, target) -> None:
+        """Copies the archives a backup's archived_years refers to into the backup."""
+        for (year,) in target.execute("SELECT year FROM archived_years ORDER BY year").fetchall():
+            path = self.archive_path(year)
+            if not os.path.exists(path):
+                logging.warning(f"Archive for {year} is missing and left out of the backup: {path}")
+                continue
+            target.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                target.execute(f"CREATE TABLE {ARCHIVE_BACKUP_PREFIX}{year} AS SELECT * FROM archive.expenses")
+                target.commit()
+            finally:
+                target.execute("DETACH DATABASE archive")
+
+    def _restore_archive(self, backup_path: str, year: int) -> None:
+        """Rewrites the archive for ``year`` from the copy embedded in a backup."""
+        path = self.archive_path(year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("ATTACH DATABASE ? AS backup", (backup_path,))
+                table = f"backup.{ARCHIVE_BACKUP_PREFIX}{year}"
+                columns = [row[1] for row in conn.execute(f"PRAGMA backup.table_info({ARCHIVE_BACKUP_PREFIX}{year})")]
+                if set(ARCHIVE_COLUMNS.split(", ")) <= set(columns):
+                    conn.execute(ARCHIVE_EXPENSES_SQL.format(table="main.expenses"))
+                    conn.execute(f"INSERT INTO main.expenses ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} FROM {table}")
+                else:
+                    # Taken before the current archive format; the schema
+                    # upgrade after the restore converts it.
+                    conn.execute(f"CREATE TABLE main.expenses AS SELECT * FROM {table}")
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _backup_prefix(self) -> str:
+        return Path(self.db_name).stem + "-"
+
+    def list_backups(self, directory: str) -> list:
+        """Returns the backups of this database in ``directory``, oldest first."""
+        if not os.path.isdir(directory):
+            return []
+        prefix = self._backup_prefix()
+        names = [
+            name for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith((".db", ".db.gz"))
+        ]
+        return [os.path.join(directory, name) for name in sorted(names)]
+
+    def backup_to_directory(self, directory: str, keep: int = 7, compress: bool = True) -> str:
+        """
+        Writes a timestamped backup into ``directory`` and rotates it so at
+        most ``keep`` backups remain.
+        """
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = self.backup(os.path.join(directory, f"{self._backup_prefix()}{stamp}.db"), compress=compress)
+        self.rotate_backups(directory, keep)
+        return path
+
+    def rotate_backups(self, directory: str, keep: int) -> None:
+        """Deletes the oldest backups in ``directory`` beyond the newest ``keep``."""
+        for path in self.list_backups(directory)[:-keep or None]:
+            try:
+                os.remove(path)
+                logging.info(f"Removed old backup: {path}")
+            except OSError as e:
+                logging.error(f"Failed to remove old backup {path}: {e}")
+
+    def schedule_backups(self, directory: str, interval: float = 24 * 3600,
+                         keep: int = 7, compress: bool = True) -> None:
+        """
+        Runs ``backup_to_directory`` every ``interval`` seconds on a daemon
+        thread. The first run is due ``interval`` after the newest existing
+        backup, so restarting the app doesn't reset the schedule.
+        """
+        self.stop_backup_schedule()
+        existing = self.list_backups(directory)
+        age = time.time() - os.path.getmtime(existing[-1]) if existing else interval
+        delay = max(0.0, interval - age)
+
+        def run():
+            try:
+                self.backup_to_directory(directory, keep, compress)
+            except Exception as e:
+                logging.error(f"Scheduled backup failed: {e}")
+            if self._backup_timer is not None:
+                self._start_backup_timer(interval, run)
+
+        self._start_backup_timer(delay, run)
+        logging.info(f"Scheduled backups to {directory} every {interval}s, first in {delay:.0f}s.")
+
+    def _start_backup_timer(self, delay: float, run) -> None:
+        self._backup_timer = threading.Timer(delay, run)
+        self._backup_timer.daemon = True
+        self._backup_timer.start()
+
+    def stop_backup_schedule(self) -> None:
+        """Cancels scheduled backups, if any."""
+        timer, self._backup_timer = self._backup_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    @staticmethod
+    def _open_backup(path: str):
+        """
+        Returns a plain database file for ``path`` and whether it is a temporary
+        copy that the caller has to remove.
+        """
+        if not path.endswith(".gz"):
+            return path, False
+        fd, tmp_path = tempfile.mkstemp(suffix=".db")
+        with os.fdopen(fd, "wb") as dst, gzip.open(path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        return tmp_path, True
+
+    def verify_backup(self, path: str) -> bool:
+        """Runs ``PRAGMA integrity_check`` against a (possibly compressed) backup."""
+        plain, is_temp = None, False
+        try:
+            plain, is_temp = self._open_backup(path)
+            conn = sqlite3.connect(Path(os.path.abspath(plain)).as_uri() + "?mode=ro", uri=True)
+            try:
+                result = conn.execute("PRAGMA integrity_check").fetchall()
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            finally:
+                conn.close()
+            ok = result == [("ok",)] and {"expenses", "budgets"} <= tables
+            logging.info(f"Verified backup {path}: {'ok' if ok else result}")
+            return ok
+        except (sqlite3.Error, OSError, EOFError) as e:
+            logging.error(f"Failed to verify backup {path}: {e}")
+            return False
+        finally:
+            if is_temp:
+                os.remove(plain)
+
+    @_refreshes_replica
+    @_flush_first
+    def restore_backup(self, path: str) -> None:
+        """Replaces the contents of the database, and its archives, with a verified backup."""
+        if not self.verify_backup(path):
+            raise ValueError(f"Backup failed verification: {path}")
+        plain, is_temp = self._open_backup(path)
+        try:
+            source = sqlite3.connect(plain)
+            try:
+                years = [
+                    int(name[len(ARCHIVE_BACKUP_PREFIX):]) for (name,) in source.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                        (f"{ARCHIVE_BACKUP_PREFIX}[0-9]*",)
+                    )
+                ]
+                for year in years:
+                    self._restore_archive(plain, year)
+                source.backup(self.conn)
+            finally:
+                source.close()
+            # The archives are back in their own files; drop the embedded copies.
+            for year in years:
+                self.conn.execute(f"DROP TABLE {ARCHIVE_BACKUP_PREFIX}{year}")
+            self.conn.commit()
+            # Category ids may differ from before, and an older backup may
+            # need the migrations start-up would run.
+            self._category_ids = {}
+            self._archives_stale = True
+            self._upgrade_schema()
+            logging.info(f"Restored database from backup {path}, with archives {years}")
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Failed to restore backup {path}: {e}")
+            raise
+        finally:
+            if is_temp:
+                os.remove(plain)
+
+    def wal_size(self) -> int:
+        """Returns the current size of the write-ahead log in bytes."""
+        try:
+            return os.path.getsize(self.db_name + "-wal")
+        except OSError:
+            return 0
+
+    def checkpoint(self, mode: str = "PASSIVE"):
+        """Runs a WAL checkpoint; returns (busy, log frames, checkpointed frames)."""
+        mode = mode.upper()
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"Invalid checkpoint mode: {mode}")
+        try:
+            result = self.conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+            logging.info(f"WAL checkpoint ({mode}): {result}")
+            return result
+        except sqlite3.Error as e:
+            logging.error(f"Failed to checkpoint WAL ({mode}): {e}")
+            raise
+
+    def optimize(self) -> None:
+        """Refreshes query planner statistics."""
+        try:
+            has_stats = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+            # PRAGMA optimize only re-analyzes tables it considers stale, so
+            # the very first run needs a full ANALYZE.
+            self.conn.execute("PRAGMA optimize;" if has_stats else "ANALYZE;")
+            self.conn.commit()
+            self._writes_since_analyze = 0
+            logging.info("Refreshed planner statistics.")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to refresh planner statistics: {e}")
+            raise
+
+    def free_pages(self) -> int:
+        """Returns the number of unused pages in the database file."""
+        return self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+
+    def incremental_vacuum(self, pages: int = VACUUM_PAGES_PER_RUN, convert: bool = False) -> int:
+        """
+        Returns up to ``pages`` free pages to the file system. A database created
+        without incremental auto-vacuum is only converted (with a full VACUUM)
+        when ``convert`` is set. Returns the number of pages reclaimed.
+        """
+        try:
+            before = self.free_pages()
+            if self.conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+                if not convert:
+                    return 0
+                self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                self.conn.execute("VACUUM;")
+                logging.info("Converted database to incremental auto-vacuum.")
+                return before
+            # execute() stops after the first step of this pragma, which frees
+            # a single page; executescript() runs it to completion.
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            reclaimed = before - self.free_pages()
+            logging.info(f"Incremental vacuum reclaimed {reclaimed} pages.")
+            return reclaimed
+        except sqlite3.Error as e:
+            logging.error(f"Failed to run incremental vacuum: {e}")
+            raise
+
+    def needs_vacuum_convert(self) -> bool:
+        """
+        True for a database created before incremental auto-vacuum once it
+        has enough free pages for a one-time conversion to be worth it.
+        """
+        if is_memory_database(self.db_name) or self.read_only:
+            return False
+        mode = self.conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+        return mode != 2 and self.free_pages() >= VACUUM_FREE_PAGES
+
+    def convert_auto_vacuum(self) -> float:
+        """
+        Converts the database to incremental auto-vacuum with a full VACUUM
+        and returns the seconds it took. Uses a connection of its own, so it
+        can run on a worker thread while this one keeps serving reads;
+        writes wait on busy_timeout until it finishes.
+        """
+        started = time.perf_counter()
+        try:
+            conn = sqlite3.connect(self.db_name, uri=True, timeout=self.busy_timeout)
+            try:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                conn.execute("VACUUM;")
+                # VACUUM rewrote the whole file into the WAL.
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to convert database to incremental auto-vacuum: {e}")
+            raise
+        seconds = time.perf_counter() - started
+        logging.info(f"Converted database to incremental auto-vacuum in {seconds:.2f}s.")
+        return seconds
+
+    def run_maintenance(self, force: bool = False, vacuum_convert: bool = False) -> dict:
+        """
+        Runs the maintenance steps that are due and returns the seconds spent
+        on each one. Meant to be called while the app is idle; the full VACUUM
+        converting an old database only runs with ``vacuum_convert``.
+        """
+        timings = {}
+
+        def timed(name, step, *args, **kwargs):
+            started = time.perf_counter()
+            step(*args, **kwargs)
+            timings[name] = time.perf_counter() - started
+
+        wal_size = self.wal_size()
+        if force or wal_size >= WAL_TRUNCATE_BYTES:
+            timed("checkpoint_truncate", self.checkpoint, "TRUNCATE")
+        elif wal_size >= WAL_CHECKPOINT_BYTES:
+            timed("checkpoint_passive", self.checkpoint, "PASSIVE")
+        if force or self._writes_since_analyze >= ANALYZE_AFTER_WRITES:
+            timed("optimize", self.optimize)
+        if self.conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+            if force or self.free_pages() >= VACUUM_FREE_PAGES:
+                timed("incremental_vacuum", self.incremental_vacuum)
+        elif vacuum_convert:
+            # A full VACUUM can take a long time on a large file; idle
+            # maintenance leaves it to convert_auto_vacuum on a worker thread.
+            # It rewrites the whole file into the WAL, so truncate that too.
+            timed("vacuum_convert", self.incremental_vacuum, convert=True)
+            timed("checkpoint_truncate", self.checkpoint, "TRUNCATE")
+        if timings:
+            logging.info(f"Maintenance finished: {timings}")
+        return timings
+
+    def contention_stats(self) -> dict:
+        """
+        Returns lock-contention counters for this connection: decorated write
+        calls and the time they took (busy_timeout waits included), busy
+        errors, retries, writes that gave up and total backoff time.
+        """
+        return dict(self._contention)
+
     def close(self) -> None:
         """Close the database connection."""
+        self.stop_backup_schedule()
         try:
+            with self._pending_lock:
+                self._stop_flush_timer()
+                self.flush()
+            if self._flush_at_exit:
+                atexit.unregister(self.flush)
+                self._flush_at_exit = False
+            if self._replica is not None:
+                self._replica.close()
+                self._replica = None
             self.conn.close()
             logging.info("Database connection closed.")
         except sqlite3.Error as e:
@@ -1,20 +1,43 @@
 from logging_config import logging
 import sqlite3
 import tkinter as tk
-from tkinter import messagebox
-from tkinter.filedialog import askopenfilename, asksaveasfilename
-from datetime import datetime
+from tkinter import messagebox, simpledialog
+from tkinter.filedialog import askdirectory, askopenfilename, asksaveasfilename
+from datetime import datetime, timedelta
+import argparse
 import csv, sys
+import multiprocessing
+import re
+import threading
+import time
 from matplotlib import pyplot as plt
 from matplotlib.dates import DateFormatter
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import ttkbootstrap as tb
 from ttkbootstrap.widgets import DateEntry
-from database_manager import DatabaseManager
+from database_manager import BUSY_MESSAGE, REPLICA_MAX_BYTES, DatabaseManager, ExpenseFilter, is_busy_error
+from finance_service import RemoteDatabaseManager, open_database
+from profiler import PROFILE_MODES, Profiler, profile_mode_from_env
+from statement_import import STATEMENT_EXTENSIONS, import_statement
+from report_generator import collect_report_data, months_between, render_reports
 from budget_manager import BudgetManager
 import sys,os 
 
-CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Others"]
+# Storage maintenance runs when nobody has touched the app for IDLE_SECONDS.
+MAINTENANCE_CHECK_MS = 30_000
+IDLE_SECONDS = 10
+DATE_PRESETS = ["All dates", "This month", "Last 90 days", "Year to date", "Custom"]
+INTERVAL_ALIASES = {"daily": "day", "weekly": "week", "monthly": "month", "yearly": "year", "annually": "year"}
+
+def parse_interval(text: str):
+    """Parse 'monthly', '2 weeks' or 'every 3 months' into (unit, count); None if unreadable."""
+    text = text.strip().lower()
+    if text in INTERVAL_ALIASES:
+        return INTERVAL_ALIASES[text], 1
+    match = re.fullmatch(r"(?:every\s+)?(\d+)?\s*(day|week|month|year)s?", text)
+    if not match:
+        return None
+    return match.group(2), int(match.group(1) or 1)
 
 def get_user_data_path(filename="expenses.db"):
     """Return a path in the user's AppData/Local/PersonalFinanceManager directory."""
@@ -46,11 +69,18 @@ class _CompatDateEntry(DateEntry):
         super().__init__(master, **kw)
     def get(self) -> str:
         return self.entry.get().strip()
+    def set(self, value: str) -> None:
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, value)
 
 class FinanceApp:
 
     
-    def __init__(self, root: tb.Window, db_file=None):
+    def __init__(self, root: tb.Window, db_file=None, db_options: dict = None):
+        """
+        db_file is a SQLite path or the URL of a running finance service;
+        db_options are passed on to DatabaseManager for local files.
+        """
         self.root = root
         self.style = self.root.style
         self._dark = False
@@ -62,9 +92,25 @@ class FinanceApp:
         # Database manager
         if db_file is None:
             db_file = get_user_data_path()
-        self.db_manager = DatabaseManager(db_file)
+        self.db_options = db_options or {}
+        self.db_manager = open_database(db_file, **self.db_options)
+        self.db_manager.schedule_backups(get_user_data_path("backups"))
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # Menu bar
+        menubar = tk.Menu(self.root)
+        reports_menu = tk.Menu(menubar, tearoff=0)
+        reports_menu.add_command(label="Monthly Reports (PNG)...",
+                                 command=lambda: self.generate_reports("png"))
+        reports_menu.add_command(label="Monthly Reports (PDF)...",
+                                 command=lambda: self.generate_reports("pdf"))
+        menubar.add_cascade(label="Reports", menu=reports_menu)
+        recurring_menu = tk.Menu(menubar, tearoff=0)
+        recurring_menu.add_command(label="Repeat This Entry...", command=self.repeat_expense)
+        recurring_menu.add_command(label="Recurring Expenses...", command=self.manage_recurring)
+        menubar.add_cascade(label="Recurring", menu=recurring_menu)
+        self.root.config(menu=menubar)
+
         # Unified container for theme
         self.container = tb.Frame(self.root)
         self.container.grid(row=0, column=0, sticky="nsew")
@@ -94,13 +140,22 @@ class FinanceApp:
         tb.Label(input_frame, text="Category:", bootstyle="secondary")\
             .grid(row=2, column=0, sticky="w", padx=5, pady=5)
 
-        self.categories = CATEGORIES
+        self.categories = self.db_manager.get_categories()
         self.category_combobox = tb.Combobox(
             input_frame, values=self.categories, state="readonly", bootstyle="info"
         )
         self.category_combobox.set("Select Category")
         self.category_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
 
+        category_btns = tb.Frame(input_frame)
+        category_btns.grid(row=2, column=2, sticky="w")
+        tb.Button(category_btns, text="+", width=2, command=self.add_category,
+                  bootstyle="success-outline").pack(side="left", padx=(0, 2))
+        tb.Button(category_btns, text="✎", width=2, command=self.rename_category,
+                  bootstyle="info-outline").pack(side="left", padx=2)
+        tb.Button(category_btns, text="−", width=2, command=self.delete_category,
+                  bootstyle="danger-outline").pack(side="left", padx=2)
+
         tb.Label(input_frame, text="Notes:", bootstyle="secondary")\
             .grid(row=3, column=0, sticky="w", padx=5, pady=5)
         self.desc_text = tb.Text(input_frame, height=4, width=30)
@@ -141,12 +196,50 @@ class FinanceApp:
         self.filter_category_combobox.set("All")
         self.filter_category_combobox.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
 
+        tb.Label(filter_frame, text="Period:", bootstyle="secondary")\
+            .grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        self.date_preset_combobox = tb.Combobox(
+            filter_frame, values=DATE_PRESETS, state="readonly", bootstyle="info"
+        )
+        self.date_preset_combobox.set(DATE_PRESETS[0])
+        self.date_preset_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+        self.date_preset_combobox.bind("<<ComboboxSelected>>", self.apply_date_preset)
+
+        range_frame = tb.Frame(filter_frame)
+        range_frame.grid(row=3, column=0, columnspan=2, sticky="ew")
+        range_frame.grid_columnconfigure((1, 3), weight=1)
+        tb.Label(range_frame, text="From:", bootstyle="secondary")\
+            .grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        self.from_entry = _CompatDateEntry(range_frame, bootstyle="info")
+        self.from_entry.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        tb.Label(range_frame, text="To:", bootstyle="secondary")\
+            .grid(row=0, column=2, sticky="w", padx=5, pady=2)
+        self.to_entry = _CompatDateEntry(range_frame, bootstyle="info")
+        self.to_entry.grid(row=0, column=3, sticky="ew", padx=5, pady=2)
+        for entry in (self.from_entry, self.to_entry):
+            entry.set("")
+            entry.entry.bind("<KeyRelease>", lambda _e: self.date_preset_combobox.set("Custom"), add="+")
+        self._date_range = (None, None)
+
         tb.Button(
             filter_frame, text="Apply", command=self.load_expenses, bootstyle="primary"
-        ).grid(row=2, column=0, sticky="ew", padx=5, pady=5)
+        ).grid(row=4, column=0, sticky="ew", padx=5, pady=5)
         tb.Button(
             filter_frame, text="Clear", command=self.clear_filters, bootstyle="secondary"
-        ).grid(row=2, column=1, sticky="ew", padx=5, pady=5)
+        ).grid(row=4, column=1, sticky="ew", padx=5, pady=5)
+
+        # Bulk edits act on everything the filters above match
+        bulk_frame = tb.Frame(filter_frame)
+        bulk_frame.grid(row=5, column=0, columnspan=2, sticky="ew")
+        tb.Label(bulk_frame, text="Matching:", bootstyle="secondary").pack(side="left", padx=5)
+        tb.Button(bulk_frame, text="Delete", command=self.bulk_delete,
+                  bootstyle="danger-outline").pack(side="left", padx=2)
+        tb.Button(bulk_frame, text="Move…", command=self.bulk_move,
+                  bootstyle="info-outline").pack(side="left", padx=2)
+        tb.Button(bulk_frame, text="Scale…", command=self.bulk_scale,
+                  bootstyle="info-outline").pack(side="left", padx=2)
+        tb.Button(bulk_frame, text="Undo", command=self.undo_bulk,
+                  bootstyle="warning-outline").pack(side="left", padx=2)
 
         # Theme toggle
         toggle_frame = tb.Frame(self.container, padding=7)
@@ -185,80 +278,246 @@ class FinanceApp:
         # Toolbar
         btn_frame = tb.Frame(self.container, padding=10)
         btn_frame.grid(row=2, column=0, columnspan=2, pady=10)
-        btn_frame.grid_columnconfigure((0,1,2,3,4), weight=1)
+        btn_frame.grid_columnconfigure((0,1,2,3,4,5,6,7,8), weight=1)
         tb.Button(btn_frame, text="Show Chart", command=self.show_chart, bootstyle="primary")\
             .grid(row=0, column=0, padx=5, pady=5)
         tb.Button(btn_frame, text="Export CSV", command=self.export_csv, bootstyle="secondary")\
             .grid(row=0, column=1, padx=5, pady=5)
-        tb.Button(btn_frame, text="Import CSV", command=self.import_csv, bootstyle="secondary")\
+        tb.Button(btn_frame, text="Import", command=self.import_csv, bootstyle="secondary")\
             .grid(row=0, column=2, padx=5, pady=5)
-        tb.Button(btn_frame, text="Manage Budgets", command=self.manage_budgets, bootstyle="info")\
+        tb.Button(btn_frame, text="Payee Rule", command=self.add_payee_rule, bootstyle="secondary")\
             .grid(row=0, column=3, padx=5, pady=5)
-        tb.Button(btn_frame, text="Delete Expense", command=self.delete_expense, bootstyle="danger")\
+        tb.Button(btn_frame, text="Manage Budgets", command=self.manage_budgets, bootstyle="info")\
             .grid(row=0, column=4, padx=5, pady=5)
+        tb.Button(btn_frame, text="Delete Expense", command=self.delete_expense, bootstyle="danger")\
+            .grid(row=0, column=5, padx=5, pady=5)
+        tb.Button(btn_frame, text="Archive Old Years", command=self.archive_old_years, bootstyle="secondary")\
+            .grid(row=0, column=6, padx=5, pady=5)
+        tb.Button(btn_frame, text="Backup", command=self.backup_database, bootstyle="secondary")\
+            .grid(row=0, column=7, padx=5, pady=5)
+        tb.Button(btn_frame, text="Restore", command=self.restore_database, bootstyle="warning")\
+            .grid(row=0, column=8, padx=5, pady=5)
 
-        # Initial load
+        # Catch up on recurring expenses due since the last start, then the
+        # initial load (also refreshes budget status and the pie chart)
+        self.materialize_recurring()
         self.load_expenses()
+
+        # Idle-time storage maintenance
+        self._last_activity = time.monotonic()
+        self._vacuum_thread = None
+        self.root.bind_all("<Any-KeyPress>", self._note_activity, add="+")
+        self.root.bind_all("<Any-ButtonPress>", self._note_activity, add="+")
+        self.root.after(MAINTENANCE_CHECK_MS, self._idle_maintenance)
+
+    def _note_activity(self, _event=None):
+        self._last_activity = time.monotonic()
+
+    def _idle_maintenance(self):
+        """Checkpoint, analyze and vacuum the database while the user is idle."""
+        if time.monotonic() - self._last_activity >= IDLE_SECONDS:
+            try:
+                self.db_manager.run_maintenance()
+                if self._vacuum_thread is None and self.db_manager.needs_vacuum_convert():
+                    # A full VACUUM of a large file takes a while; keep it off the UI thread.
+                    self._vacuum_thread = threading.Thread(target=self._convert_auto_vacuum, daemon=True)
+                    self._vacuum_thread.start()
+            except Exception as e:
+                logging.error(f"Storage maintenance failed: {e}")
+        self.root.after(MAINTENANCE_CHECK_MS, self._idle_maintenance)
+
+    def _convert_auto_vacuum(self):
+        """Worker thread: converts an old database to incremental auto-vacuum once."""
+        try:
+            self.db_manager.convert_auto_vacuum()
+        except Exception as e:
+            logging.error(f"Auto-vacuum conversion failed: {e}")
+
+    def _show_db_error(self, error, message, title="Database Error"):
+        """Show a failed database call, telling lock contention apart from real errors."""
+        if is_busy_error(error):
+            messagebox.showwarning("Database Busy", BUSY_MESSAGE)
+        else:
+            messagebox.showerror(title, message)
+
+    def load_expenses(self):
+        """Load and display expenses, applying search, category & date filters."""
+        try:
+            flt = self._current_filter()
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return
+        self._date_range = (flt.start, flt.end)
+        self._fill_tree(self.db_manager.iter_expenses(flt))
+
         self.check_budget()
         self.update_pie_chart()
+        if hasattr(self, "budget_manager") and self.budget_manager:
+            self.budget_manager.show_budget_vs_spending()
 
-    def load_expenses(self):
-        """Load and display expenses, applying search & category filters."""
-        search_term = self.search_entry.get().strip().lower()
+    def _fill_tree(self, expenses):
+        """Replace the expense list with ``expenses``."""
+        self.tree.delete(*self.tree.get_children())
+        for expense in expenses:
+            self.tree.insert("", "end", values=(
+                expense.date, expense.amount, expense.category, expense.description
+            ))
+
+    def _current_filter(self):
+        """
+        Build an ExpenseFilter from the filter panel. Filters run in SQL over
+        the date index; archived years are listed too, like in the pie chart
+        and budget totals, but only the archives a range touches are opened.
+        """
+        start, end = self._read_date_filters()
         selected_cat = self.filter_category_combobox.get()
+        return ExpenseFilter(
+            start, end,
+            category=None if selected_cat == "All" else selected_cat,
+            search=self.search_entry.get().strip(),
+            include_archived=True,
+        )
 
-        self.tree.delete(*self.tree.get_children())
-        for _id, date, amount, category, desc in self.db_manager.get_all_expenses():
-            if selected_cat != "All" and category != selected_cat:
-                continue
-            if search_term:
-                if all(
-                    search_term not in str(field).lower()
-                    for field in (date, amount, category, desc)
-                ):
-                    continue
-            self.tree.insert("", "end", values=(date, amount, category, desc))
+    def _read_date_filters(self):
+        """Validate the From/To entries; empty entries leave that end open."""
+        start, end = self.from_entry.get() or None, self.to_entry.get() or None
+        for label, value in (("From", start), ("To", end)):
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    raise ValueError(f"{label} date must be in YYYY-MM-DD format.")
+        if start and end and start > end:
+            raise ValueError("From date must not be after To date.")
+        return start, end
 
-        self.update_pie_chart()
+    def date_range(self):
+        """The (start, end) range last applied; None means unbounded."""
+        return self._date_range
+
+    def apply_date_preset(self, _event=None):
+        """Fill the From/To entries from the selected preset and reload."""
+        preset = self.date_preset_combobox.get()
+        if preset == "Custom":
+            return
+        today = datetime.now().date()
+        start = {
+            "This month": today.replace(day=1),
+            "Last 90 days": today - timedelta(days=89),
+            "Year to date": today.replace(month=1, day=1),
+        }.get(preset)
+        self.from_entry.set(start.isoformat() if start else "")
+        self.to_entry.set(today.isoformat() if start else "")
+        self.load_expenses()
+
+    def refresh_categories(self):
+        """Reload category choices from the database into every combobox."""
+        self.categories = self.db_manager.get_categories()
+        self.category_combobox.configure(values=self.categories)
+        self.filter_category_combobox.configure(values=["All"] + self.categories)
+        if self.filter_category_combobox.get() not in ["All"] + self.categories:
+            self.filter_category_combobox.set("All")
+        if hasattr(self, "budget_manager") and self.budget_manager:
+            self.budget_manager.refresh_categories()
+
+    def add_category(self):
+        name = simpledialog.askstring("New Category", "Category name:", parent=self.root)
+        if not name: return
+        try:
+            self.db_manager.add_category(name)
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return
+        except Exception as e:
+            logging.error(f"Failed to add category: {e}")
+            self._show_db_error(e, "Failed to add category."); return
+        self.refresh_categories()
+        self.category_combobox.set(name.strip())
+
+    def rename_category(self):
+        old = self.category_combobox.get()
+        if old not in self.categories:
+            messagebox.showerror("Selection Error", "Select a category to rename."); return
+        new = simpledialog.askstring("Rename Category", f"New name for '{old}':",
+                                     initialvalue=old, parent=self.root)
+        if not new or new.strip() == old: return
+        try:
+            self.db_manager.rename_category(old, new)
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return
+        except Exception as e:
+            logging.error(f"Failed to rename category: {e}")
+            self._show_db_error(e, "Failed to rename category."); return
+        self.refresh_categories()
+        self.category_combobox.set(new.strip())
+        self.load_expenses()
+        self.check_budget()
+
+    def delete_category(self):
+        name = self.category_combobox.get()
+        if name not in self.categories:
+            messagebox.showerror("Selection Error", "Select a category to delete."); return
+        if not messagebox.askyesno("Confirm", f"Delete category '{name}'?"): return
+        try:
+            self.db_manager.delete_category(name)
+        except ValueError as ve:
+            messagebox.showerror("Delete Error", str(ve)); return
+        except Exception as e:
+            logging.error(f"Failed to delete category: {e}")
+            self._show_db_error(e, "Failed to delete category."); return
+        self.category_combobox.set("Select Category")
+        self.refresh_categories()
 
     def clear_filters(self):
-        """Reset search & category filters."""
+        """Reset search, category & date filters."""
         self.search_entry.delete(0, tk.END)
         self.filter_category_combobox.set("All")
+        self.date_preset_combobox.set(DATE_PRESETS[0])
+        self.from_entry.set("")
+        self.to_entry.set("")
         self.load_expenses()
 
-    def add_expense(self):
+    def _read_expense_form(self):
+        """Validate the entry form; returns (date, amount, category, description) or None."""
         date_str = self.date_entry.get()
         amount_str = self.amount_entry.get().strip()
         category = self.category_combobox.get()
         desc = self.desc_text.get("1.0", tk.END).strip()
 
         if not date_str:
-            messagebox.showerror("Input Error", "Please select a date."); return
+            messagebox.showerror("Input Error", "Please select a date."); return None
         if category == "Select Category":
-            messagebox.showerror("Input Error", "Please select a category."); return
+            messagebox.showerror("Input Error", "Please select a category."); return None
         try:
             datetime.strptime(date_str, "%Y-%m-%d")
         except ValueError:
-            messagebox.showerror("Input Error", "Date must be YYYY-MM-DD."); return
+            messagebox.showerror("Input Error", "Date must be YYYY-MM-DD."); return None
         if not amount_str:
-            messagebox.showerror("Input Error", "Amount field cannot be empty."); return
+            messagebox.showerror("Input Error", "Amount field cannot be empty."); return None
         try:
             amount = float(amount_str)
             if amount <= 0:
                 raise ValueError("Amount must be greater than zero.")
         except ValueError as ve:
-            messagebox.showerror("Input Error", str(ve)); return
+            messagebox.showerror("Input Error", str(ve)); return None
         if not desc:
-            messagebox.showerror("Input Error", "Description cannot be empty."); return
+            messagebox.showerror("Input Error", "Description cannot be empty."); return None
         if len(desc) > 255:
-            messagebox.showerror("Input Error", "Description ≤ 255 characters."); return
+            messagebox.showerror("Input Error", "Description ≤ 255 characters."); return None
+        return date_str, amount, category, desc
+
+    def add_expense(self):
+        entry = self._read_expense_form()
+        if entry is None: return
+        date_str, amount, category, desc = entry
 
         try:
+            if self.db_manager.expense_exists(date_str, amount, category, desc) and not messagebox.askyesno(
+                "Duplicate Expense", "An identical expense already exists. Add it anyway?"
+            ):
+                return
             self.db_manager.add_expense(date_str, amount, category, desc)
         except Exception as e:
             logging.error(f"Failed to add expense: {e}")
-            messagebox.showerror("Database Error", "Failed to add expense. Please try again.")
+            self._show_db_error(e, "Failed to add expense. Please try again.")
             return
 
         self.amount_entry.delete(0, tk.END)
@@ -286,23 +545,89 @@ class FinanceApp:
             messagebox.showinfo("Success", "Deleted.")
         except Exception as e:
             logging.error(f"Failed to delete expense: {e}")
-            messagebox.showerror("Deletion Error", "Failed to delete expense. Please try again.")
+            self._show_db_error(e, "Failed to delete expense. Please try again.", "Deletion Error")
         self.update_pie_chart()
 
+    def _bulk_edit(self, action, verb, *args):
+        """Count what the filters match, confirm, then apply one bulk operation."""
+        try:
+            flt = self._current_filter()
+            count = action(flt, *args, dry_run=True)
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return False
+        except Exception as e:
+            logging.error(f"Failed to count matching expenses: {e}")
+            messagebox.showerror("Database Error", "Failed to count matching expenses."); return False
+        if not count:
+            messagebox.showinfo("Bulk Edit", "No expenses match the current filters."); return False
+        if not messagebox.askyesno(
+            "Confirm",
+            f"{verb} {count} matching expense(s)?\n"
+            "Archived years are not changed. This can be undone with Undo."
+        ):
+            return False
+        try:
+            action(flt, *args)
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return False
+        except Exception as e:
+            logging.error(f"Bulk edit failed: {e}")
+            self._show_db_error(e, "Bulk edit failed; nothing was changed."); return False
+        self.load_expenses()
+        return True
+
+    def bulk_delete(self):
+        self._bulk_edit(self.db_manager.bulk_delete, "Delete")
+
+    def bulk_move(self):
+        category = simpledialog.askstring(
+            "Move Expenses", "Move matching expenses to category:", parent=self.root
+        )
+        if not category or not category.strip(): return
+        if self._bulk_edit(self.db_manager.bulk_recategorize, f"Move to '{category.strip()}'", category):
+            self.refresh_categories()
+
+    def bulk_scale(self):
+        factor = simpledialog.askfloat(
+            "Scale Amounts", "Multiply matching amounts by:", parent=self.root, minvalue=0.0001
+        )
+        if factor is None: return
+        self._bulk_edit(self.db_manager.bulk_scale, f"Multiply by {factor:g} the amounts of", factor)
+
+    def undo_bulk(self):
+        try:
+            info = self.db_manager.get_undo_info()
+        except Exception as e:
+            logging.error(f"Failed to read undo snapshot: {e}")
+            messagebox.showerror("Database Error", "Failed to read undo information."); return
+        if not info:
+            messagebox.showinfo("Undo", "There is no bulk edit to undo."); return
+        operation, count = info
+        if not messagebox.askyesno("Confirm", f"Undo the last bulk {operation} of {count} expense(s)?"):
+            return
+        try:
+            self.db_manager.undo_bulk()
+        except ValueError as ve:
+            messagebox.showerror("Undo Error", str(ve)); return
+        except Exception as e:
+            logging.error(f"Failed to undo bulk edit: {e}")
+            self._show_db_error(e, "Failed to undo bulk edit."); return
+        self.load_expenses()
+
     def show_chart(self):
         try:
-            rows = self.db_manager.get_all_expenses()
+            rows = self.db_manager.get_daily_totals()
             if not rows:
                 messagebox.showinfo("No Data", "No expenses to chart."); return
-            dates = [datetime.strptime(r[1], "%Y-%m-%d") for r in rows]
-            amounts = [r[2] for r in rows]
-            dates, amounts = zip(*sorted(zip(dates, amounts)))
+            dates = [datetime.strptime(day, "%Y-%m-%d") for day, _ in rows]
+            amounts = [total for _, total in rows]
 
             plt.figure(figsize=(12, 8))
-            plt.plot(dates, amounts, marker="o", linestyle="-", label="Spending")
-            for d, a in zip(dates, amounts):
-                plt.annotate(f"${a:.2f}", (d, a),
-                             textcoords="offset points", xytext=(0, 10), ha="center")
+            plt.plot(dates, amounts, marker="o", linestyle="-", label="Spending per day")
+            if len(rows) <= 60:
+                for d, a in zip(dates, amounts):
+                    plt.annotate(f"${a:.2f}", (d, a),
+                                 textcoords="offset points", xytext=(0, 10), ha="center")
             plt.gca().xaxis.set_major_formatter(DateFormatter("%b %d"))
             plt.gcf().autofmt_xdate()
             plt.title("Spending Trends Over Time")
@@ -320,13 +645,16 @@ class FinanceApp:
         path = asksaveasfilename(defaultextension=".csv",
                                  filetypes=[("CSV files", "*.csv")])
         if not path: return
-        rows = self.db_manager.get_all_expenses()
-        if not rows:
+        # Streamed batch by batch, so memory stays flat however long the history.
+        rows = self.db_manager.iter_expenses(ExpenseFilter(include_archived=True))
+        first = next(rows, None)
+        if first is None:
             messagebox.showinfo("Export Error", "No expenses to export."); return
         try:
             with open(path, "w", newline="", encoding="utf-8") as f:
                 w = csv.writer(f)
                 w.writerow(["ID", "Date", "Amount", "Category", "Description"])
+                w.writerow(first)
                 w.writerows(rows)
             messagebox.showinfo("Export Successful", f"Saved to {path}")
         except Exception as e:
@@ -334,8 +662,13 @@ class FinanceApp:
             messagebox.showerror("Export Error", "Failed to export CSV.")
 
     def import_csv(self):
-        path = askopenfilename(filetypes=[("CSV files", "*.csv")])
+        statements = " ".join(f"*{ext}" for ext in STATEMENT_EXTENSIONS)
+        path = askopenfilename(filetypes=[("CSV files and bank statements", f"*.csv {statements}"),
+                                          ("CSV files", "*.csv"),
+                                          ("Bank statements (OFX, QFX, QIF)", statements)])
         if not path: return
+        if os.path.splitext(path)[1].lower() in STATEMENT_EXTENSIONS:
+            self.import_bank_statement(path); return
         try:
             with open(path, newline="", encoding="utf-8") as f:
                 reader = csv.DictReader(f)
@@ -356,11 +689,243 @@ class FinanceApp:
                         bad += 1
                 if bulk:
                     self.db_manager.add_expenses_bulk(bulk)
+                self.refresh_categories()
                 self.load_expenses()
                 messagebox.showinfo("Import Complete", f"Imported {good}, skipped {bad}.")
         except Exception as e:
             logging.error(f"Error importing CSV: {e}")
-            messagebox.showerror("Import Error", str(e))
+            self._show_db_error(e, str(e), "Import Error")
+
+    def import_bank_statement(self, path):
+        try:
+            counts = import_statement(self.db_manager, path)
+        except Exception as e:
+            # Batches written before the failure stay; importing again skips them.
+            logging.error(f"Error importing statement {path}: {e}")
+            self._show_db_error(e, f"Failed to import statement: {e}", "Import Error")
+            return
+        finally:
+            self.refresh_categories()
+            self.load_expenses()
+        messagebox.showinfo(
+            "Import Complete",
+            f"Imported {counts['imported']} expenses.\n"
+            f"Skipped {counts['duplicates']} already imported, {counts['credits']} credits "
+            f"and {counts['unreadable']} unreadable transactions."
+        )
+
+    def add_payee_rule(self):
+        pattern = simpledialog.askstring(
+            "Payee Rule", "Imported payees containing this text:", parent=self.root
+        )
+        if not pattern or not pattern.strip(): return
+        category = simpledialog.askstring(
+            "Payee Rule", f"Put payees containing '{pattern.strip()}' in category:", parent=self.root
+        )
+        if not category or not category.strip(): return
+        try:
+            self.db_manager.set_payee_rule(pattern, category.strip())
+        except Exception as e:
+            logging.error(f"Failed to set payee rule: {e}")
+            self._show_db_error(e, "Failed to save the payee rule.")
+            return
+        self.refresh_categories()
+        messagebox.showinfo("Payee Rule", f"Future imports will file '{pattern.strip()}' under {category.strip()}.")
+
+    def materialize_recurring(self):
+        try:
+            return self.db_manager.materialize_recurring()
+        except Exception as e:
+            # Retried at the next start; the occurrences are not lost.
+            logging.error(f"Failed to materialize recurring expenses: {e}")
+            return 0
+
+    def repeat_expense(self):
+        entry = self._read_expense_form()
+        if entry is None: return
+        date_str, amount, category, desc = entry
+        text = simpledialog.askstring(
+            "Recurring Expense",
+            f"Repeat '{desc}' from {date_str} every (e.g. month, 2 weeks, year):",
+            parent=self.root, initialvalue="month"
+        )
+        if not text: return
+        interval = parse_interval(text)
+        if interval is None:
+            messagebox.showerror("Input Error", "Enter an interval such as 'month', '2 weeks' or 'year'."); return
+        unit, count = interval
+        end = simpledialog.askstring(
+            "Recurring Expense", "Last date (YYYY-MM-DD), or leave empty to repeat indefinitely:",
+            parent=self.root
+        )
+        if end is None: return
+        end = end.strip() or None
+        if end:
+            try:
+                datetime.strptime(end, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Input Error", "Date must be YYYY-MM-DD."); return
+        try:
+            self.db_manager.add_recurring_rule(desc, amount, category, date_str, unit, count, end)
+        except ValueError as ve:
+            messagebox.showerror("Input Error", str(ve)); return
+        except Exception as e:
+            logging.error(f"Failed to add recurring expense: {e}")
+            self._show_db_error(e, "Failed to add the recurring expense.")
+            return
+        added = self.materialize_recurring()
+        self.amount_entry.delete(0, tk.END)
+        self.desc_text.delete("1.0", tk.END)
+        self.category_combobox.set("Select Category")
+        self.refresh_categories()
+        self.load_expenses()
+        messagebox.showinfo("Recurring Expense", f"Saved. {added} occurrence(s) due so far were added.")
+
+    def manage_recurring(self):
+        try:
+            rules = self.db_manager.get_recurring_rules()
+        except Exception as e:
+            logging.error(f"Failed to fetch recurring expenses: {e}")
+            messagebox.showerror("Database Error", "Failed to load recurring expenses."); return
+        window = tk.Toplevel(self.root)
+        window.title("Recurring Expenses")
+        columns = ("description", "amount", "category", "every", "start", "end")
+        tree = tb.Treeview(window, columns=columns, show="headings", bootstyle="info-border", height=10)
+        for col in columns:
+            tree.heading(col, text=col.capitalize())
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        for rule_id, desc, amount, category, start, end, unit, count, _through in rules:
+            every = unit if count == 1 else f"{count} {unit}s"
+            tree.insert("", tk.END, iid=str(rule_id),
+                        values=(desc, f"{amount:.2f}", category, every, start, end or ""))
+
+        def delete_rule():
+            sel = tree.selection()
+            if not sel: return
+            if not messagebox.askyesno(
+                "Confirm", "Stop this recurring expense? Expenses already added are kept.", parent=window
+            ):
+                return
+            try:
+                self.db_manager.delete_recurring_rule(int(sel[0]))
+            except Exception as e:
+                logging.error(f"Failed to delete recurring expense: {e}")
+                self._show_db_error(e, "Failed to delete the recurring expense.")
+                return
+            tree.delete(sel[0])
+
+        tb.Button(window, text="Stop Selected", command=delete_rule, bootstyle="danger")\
+            .pack(pady=(0, 10))
+
+    def archive_old_years(self):
+        year = datetime.now().year
+        if not messagebox.askyesno(
+            "Archive",
+            f"Move all expenses dated before {year} into yearly archive files?\n"
+            "Archived expenses still count towards totals and exports."
+        ):
+            return
+        try:
+            moved = self.db_manager.archive_closed_years(year)
+        except Exception as e:
+            logging.error(f"Failed to archive old years: {e}")
+            self._show_db_error(e, "Failed to archive old years.", "Archive Error")
+            return
+        self.load_expenses()
+        if moved:
+            summary = ", ".join(f"{y}: {n}" for y, n in moved.items())
+            messagebox.showinfo("Archive Complete", f"Archived expenses per year: {summary}")
+        else:
+            messagebox.showinfo("Archive Complete", "Nothing to archive.")
+
+    def backup_database(self):
+        path = asksaveasfilename(defaultextension=".db",
+                                 filetypes=[("Database backup", "*.db"),
+                                            ("Compressed backup", "*.gz")])
+        if not path: return
+        result = {}
+
+        def worker():
+            try:
+                result["path"] = self.db_manager.backup(path, compress=path.endswith(".gz"))
+            except Exception as e:
+                result["error"] = e
+
+        # The backup API copies in small steps on its own connection, so the
+        # UI stays responsive while the worker runs.
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_backup(thread, result)
+
+    def _poll_backup(self, thread, result):
+        if thread.is_alive():
+            self.root.after(100, self._poll_backup, thread, result)
+            return
+        if "error" in result:
+            logging.error(f"Backup failed: {result['error']}")
+            messagebox.showerror("Backup Error", "Failed to back up the database.")
+        else:
+            messagebox.showinfo("Backup Complete", f"Saved to {result['path']}")
+
+    def generate_reports(self, fmt):
+        today = datetime.now()
+        year = simpledialog.askinteger(
+            "Monthly Reports", "Render one page per month of year:", parent=self.root,
+            initialvalue=today.year, minvalue=1900, maxvalue=today.year
+        )
+        if year is None: return
+        out_dir = askdirectory(title="Save reports to")
+        if not out_dir: return
+        last = min(f"{year:04d}-12", today.strftime("%Y-%m"))
+        try:
+            pages = collect_report_data(self.db_manager, months_between(f"{year:04d}-01", last))
+        except Exception as e:
+            logging.error(f"Failed to collect report data: {e}")
+            self._show_db_error(e, "Failed to read the data for the reports.", "Report Error")
+            return
+        result = {}
+
+        def worker():
+            try:
+                result["paths"] = render_reports(pages, out_dir, fmt)
+            except Exception as e:
+                result["error"] = e
+
+        # Pages render in worker processes; the data was read above, on the
+        # UI thread that owns the connection.
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self._poll_reports(thread, result, out_dir)
+
+    def _poll_reports(self, thread, result, out_dir):
+        if thread.is_alive():
+            self.root.after(100, self._poll_reports, thread, result, out_dir)
+            return
+        if "error" in result:
+            logging.error(f"Report generation failed: {result['error']}")
+            messagebox.showerror("Report Error", "Failed to generate the reports.")
+        else:
+            messagebox.showinfo("Reports Complete", f"Saved {len(result['paths'])} reports to {out_dir}")
+
+    def restore_database(self):
+        path = askopenfilename(filetypes=[("Database backup", "*.db *.gz")])
+        if not path: return
+        if not messagebox.askyesno(
+            "Restore", "Replace all current expenses and budgets with this backup?"
+        ):
+            return
+        try:
+            self.db_manager.restore_backup(path)
+        except ValueError:
+            messagebox.showerror("Restore Error", "The backup failed its integrity check.")
+            return
+        except Exception as e:
+            logging.error(f"Failed to restore backup: {e}")
+            self._show_db_error(e, "Failed to restore the backup.", "Restore Error")
+            return
+        self.load_expenses()
+        self.check_budget()
+        messagebox.showinfo("Restore Complete", "Database restored from backup.")
 
     def manage_budgets(self):
         if hasattr(self, "budget_window") and self.budget_window.winfo_exists():
@@ -376,19 +941,32 @@ class FinanceApp:
 
         self.budget_window = tk.Toplevel(self.root)
         self.budget_window.protocol("WM_DELETE_WINDOW", on_budget_window_close)  
-        self.budget_manager = BudgetManager(self.budget_window, self.style, on_budget_update, db_file= self.db_manager.db_name)
+        # The budget window opens its own connection; one memory replica per
+        # process is enough, so it reads the file directly.
+        budget_options = {k: v for k, v in self.db_options.items()
+                          if k not in ("memory_replica", "replica_max_bytes")}
+        self.budget_manager = BudgetManager(self.budget_window, self.style, on_budget_update,
+                                            db_file=self.db_manager.db_name, date_range=self.date_range,
+                                            db_options=budget_options)
 
     def check_budget(self):
+        """Compare this month's spending, and its month-end projection, with the budgets."""
         budgets = {cat: budget for cat, budget, *_ in self.db_manager.get_all_budgets()}
-        cursor = self.db_manager.conn.cursor()
-        cursor.execute("SELECT category, SUM(amount) FROM expenses GROUP BY category")
-        spent = {cat: total or 0.0 for cat, total in cursor.fetchall()}
-        over = [f"{c}: ${spent[c]:.2f} > ${budgets[c]:.2f}"
-                for c in budgets if spent.get(c, 0.0) > budgets[c]]
-        if over:
+        forecast = self.db_manager.get_spending_forecast()
+        spent = {c: so_far for c, (so_far, _) in forecast.items()}
+        exceeded = {c for c in budgets if spent.get(c, 0.0) > budgets[c]}
+        over = [f"{c}: ${spent[c]:.2f} > ${budgets[c]:.2f}" for c in budgets if c in exceeded]
+        at_risk = [f"{c}: ${forecast[c][1]:.2f} projected > ${budgets[c]:.2f}"
+                   for c in budgets if c in forecast and c not in exceeded and budgets[c] < forecast[c][1]]
+        if over or at_risk:
+            sections = []
+            if over:
+                sections.append("Exceeded Budgets This Month:\n" + "\n".join(over))
+            if at_risk:
+                sections.append("Projected to Exceed by Month-End:\n" + "\n".join(at_risk))
             self.budget_label.config(
-                text="Exceeded Budgets:\n" + "\n".join(over),
-                foreground="red"
+                text="\n".join(sections),
+                foreground="red" if over else "orange"
             )
         else:
             self.budget_label.config(
@@ -416,9 +994,7 @@ class FinanceApp:
 
     def update_pie_chart(self):
         try:
-            cursor = self.db_manager.conn.cursor()
-            cursor.execute("SELECT category, SUM(amount) FROM expenses GROUP BY category")
-            data = cursor.fetchall()
+            data = list(self.db_manager.get_category_totals(*self.date_range()).items())
             if not data:
                 if self.chart_canvas:
                     self.chart_canvas.get_tk_widget().destroy()
@@ -463,7 +1039,49 @@ class FinanceApp:
             self.root.destroy()
             sys.exit()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Personal Finance Manager")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", help="path of the expenses database")
+    source.add_argument("--server", help="URL of a running finance service, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--profile", nargs="?", const="spans", choices=PROFILE_MODES,
+                        help="record where time goes and write a report on exit (or set PFM_PROFILE)")
+    parser.add_argument("--memory-replica", nargs="?", type=int, const=REPLICA_MAX_BYTES // (1024 * 1024),
+                        metavar="MB", help="serve reads from an in-memory copy of the database, "
+                        "unless it is larger than MB megabytes (default %(const)s)")
+    return parser.parse_args(argv)
+
+
+def database_options(args) -> dict:
+    """DatabaseManager options chosen on the command line."""
+    if args.memory_replica is None:
+        return {}
+    return {"memory_replica": True, "replica_max_bytes": args.memory_replica * 1024 * 1024}
+
+def enable_profiling(mode):
+    """Instrument the UI, chart and database classes before any window exists."""
+    profiler = Profiler(get_user_data_path("profiles"), cprofile=(mode == "cprofile"))
+    profiler.instrument(FinanceApp, "ui", overrides={
+        "update_pie_chart": "chart", "show_chart": "chart", "_fill_tree": "tree",
+    })
+    profiler.instrument(BudgetManager, "ui", overrides={
+        "draw_piechart": "chart", "update_charts": "chart", "_update_pie": "chart",
+        "_update_bars": "chart", "redraw_budget_chart": "chart",
+    })
+    # Canvas draws also run later from draw_idle, outside any UI callback.
+    profiler.instrument(FigureCanvasTkAgg, "chart", names=["draw"])
+    profiler.instrument(DatabaseManager, "query")
+    profiler.instrument(RemoteDatabaseManager, "query", names=["_read", "call_batch"])
+    profiler.start()
+    return profiler
+
 if __name__ == "__main__":
+    # Report pages render in worker processes, which a frozen build must support.
+    multiprocessing.freeze_support()
+    args = parse_args()
+    mode = args.profile or profile_mode_from_env()
+    if mode:
+        enable_profiling(mode)
     root = tb.Window(themename="flatly")
-    FinanceApp(root)
+    FinanceApp(root, db_file=args.server or args.db, db_options=database_options(args))
     root.mainloop()
@@ -0,0 +1,411 @@
+"""
+Local HTTP/JSON service over DatabaseManager.
+
+Several app instances can share one expenses.db by pointing them at a single
+service instead of opening the file themselves:
+
+    python finance_service.py --db expenses.db --port 8765
+    python finance_app.py --server http://127.0.0.1:8765
+
+Reads are served from a bounded pool of read-only connections and carry an
+ETag derived from PRAGMA data_version, so unchanged aggregates cost a 304.
+All writes go through one connection, one request at a time. Writes must be
+JSON POSTs from the service's own origin, so web pages can't forge them.
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from database_manager import Budget, DatabaseManager, Expense, ExpenseFilter
+from logging_config import logging
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_READERS = 4
+READER_WAIT_SECONDS = 30
+
+# DatabaseManager methods exposed over HTTP.
+READ_METHODS = {
+    "get_categories",
+    "get_all_expenses",
+    "get_expenses",
+    "expense_exists",
+    "get_expense_id",
+    "get_all_budgets",
+    "get_remaining_budget",
+    "get_archived_years",
+    "get_expenses_between",
+    "get_category_totals",
+    "get_daily_totals",
+    "get_period_totals",
+    "get_undo_info",
+    "get_payee_rules",
+    "get_spending_forecast",
+    "get_recurring_rules",
+}
+WRITE_METHODS = {
+    "add_category",
+    "rename_category",
+    "delete_category",
+    "add_expense",
+    "delete_expense",
+    "add_expenses_bulk",
+    "add_or_update_budget",
+    "update_spent",
+    "delete_budget",
+    "archive_closed_years",
+    "check_rollups",
+    "bulk_delete",
+    "bulk_recategorize",
+    "bulk_scale",
+    "undo_bulk",
+    "add_statement_rows",
+    "set_payee_rule",
+    "delete_payee_rule",
+    "add_recurring_rule",
+    "delete_recurring_rule",
+    "materialize_recurring",
+}
+
+# Read results the client turns back into record objects.
+RECORD_TYPES = {
+    "get_all_expenses": Expense,
+    "get_expenses": Expense,
+    "get_expenses_between": Expense,
+    "get_all_budgets": Budget,
+}
+
+
+class RemoteDatabaseError(sqlite3.Error):
+    """Raised by RemoteDatabaseManager when the service reports a failure."""
+
+
+class FinanceService:
+    """Serves a DatabaseManager over HTTP with pooled readers and a single writer."""
+
+    def __init__(self, db_file: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 readers: int = DEFAULT_READERS):
+        self.db_file = db_file
+        self.writer = DatabaseManager(db_file, check_same_thread=False)
+        self._write_lock = threading.Lock()
+        self._generation = 0
+        # A connection of its own for data_version, so revalidating a read
+        # never waits for the writer.
+        self._version_conn = sqlite3.connect(
+            Path(os.path.abspath(db_file)).as_uri() + "?mode=ro", uri=True, check_same_thread=False
+        )
+        self._version_lock = threading.Lock()
+        self._readers = queue.Queue(maxsize=readers)
+        for _ in range(readers):
+            self._readers.put(DatabaseManager(db_file, read_only=True, check_same_thread=False))
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def hosts(self) -> set:
+        """Host header values the service answers to; anything else is refused."""
+        host, port = self.httpd.server_address[:2]
+        return {f"{name}:{port}" for name in ("127.0.0.1", "localhost", host)}
+
+    def etag(self) -> str:
+        """
+        Changes whenever the database does. data_version catches commits from
+        any other connection, our writer's included, and the generation
+        counter every write call; neither needs the write lock, so reads
+        don't queue behind a long write.
+        """
+        generation = self._generation
+        with self._version_lock:
+            version = self._version_conn.execute("PRAGMA data_version;").fetchone()[0]
+        return f'"{version}-{generation}"'
+
+    def read(self, method: str, args: list, kwargs: dict):
+        """Runs a read method on a pooled read-only connection."""
+        try:
+            db = self._readers.get(timeout=READER_WAIT_SECONDS)
+        except queue.Empty:
+            raise sqlite3.OperationalError("No reader connection available.")
+        try:
+            return getattr(db, method)(*args, **kwargs)
+        finally:
+            self._readers.put(db)
+
+    def write(self, calls: list) -> list:
+        """Runs a batch of write calls back to back while holding the writer."""
+        with self._write_lock:
+            try:
+                return [getattr(self.writer, method)(*args, **kwargs) for method, args, kwargs in calls]
+            finally:
+                self._generation += 1
+
+    def start(self) -> None:
+        """Serves requests on a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Finance service listening on {self.url}")
+
+    def serve_forever(self) -> None:
+        logging.info(f"Finance service listening on {self.url}")
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        """Stops serving and closes every connection."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self.writer.close()
+        self._version_conn.close()
+        logging.info("Finance service stopped.")
+
+
+def _make_handler(service: FinanceService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logging.info("service: " + format % args)
+
+        def _send(self, status: int, payload=None, etag: str = None):
+            body = b"" if payload is None else json.dumps(payload, default=_to_json).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _run(self, func):
+            try:
+                return func()
+            except (KeyError, TypeError, ValueError) as e:
+                # ValueError also carries validation messages such as
+                # "Category 'Food' already exists." back to the client.
+                self._send(400, {"error": str(e)})
+            except sqlite3.OperationalError as e:
+                self._send(503, {"error": str(e)})
+            except sqlite3.Error as e:
+                self._send(500, {"error": str(e)})
+            return None
+
+        def _refuse(self, status: int, message: str) -> bool:
+            # The body is never read, so the connection can't be reused.
+            self.close_connection = True
+            self._send(status, {"error": message})
+            return False
+
+        def _allowed(self, write: bool = False) -> bool:
+            """
+            Refuses requests a web page could forge: a Host other than the
+            service's own (DNS rebinding), and for writes a foreign Origin or
+            a body that isn't JSON, which browsers send without a preflight.
+            """
+            if self.headers.get("Host") not in service.hosts:
+                return self._refuse(403, "Unexpected Host header.")
+            if not write:
+                return True
+            origin = self.headers.get("Origin")
+            if origin is not None and urllib.parse.urlsplit(origin).netloc not in service.hosts:
+                return self._refuse(403, f"Cross-origin request from {origin} refused.")
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                return self._refuse(415, "Request body must be application/json.")
+            return True
+
+        def do_GET(self):
+            if not self._allowed():
+                return
+            url = urllib.parse.urlsplit(self.path)
+            method = url.path.removeprefix("/api/")
+            if method not in READ_METHODS:
+                self._send(404, {"error": f"Unknown read method: {method}"})
+                return
+            query = urllib.parse.parse_qs(url.query)
+            etag = service.etag()
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, etag=etag)
+                return
+
+            def read():
+                args = json.loads(query.get("args", ["[]"])[0])
+                kwargs = json.loads(query.get("kwargs", ["{}"])[0])
+                self._send(200, {"result": service.read(method, args, kwargs)}, etag=etag)
+            self._run(read)
+
+        def do_POST(self):
+            if not self._allowed(write=True):
+                return
+            method = urllib.parse.urlsplit(self.path).path.removeprefix("/api/")
+
+            def write():
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if method == "batch":
+                    calls = [(c["method"], c.get("args", []), c.get("kwargs", {})) for c in body["calls"]]
+                else:
+                    calls = [(method, body.get("args", []), body.get("kwargs", {}))]
+                unknown = [name for name, _, _ in calls if name not in WRITE_METHODS]
+                if unknown:
+                    self._send(404, {"error": f"Unknown write method: {', '.join(unknown)}"})
+                    return
+                results = service.write(calls)
+                self._send(200, {"results": results} if method == "batch" else {"result": results[0]})
+            self._run(write)
+
+    return Handler
+
+
+def _to_json(value):
+    """Encodes filters as dicts and records as lists."""
+    if isinstance(value, ExpenseFilter):
+        return value.as_dict()
+    return list(value)
+
+
+class RemoteDatabaseManager:
+    """
+    Client for FinanceService exposing the same methods as DatabaseManager,
+    so the UI can use either one. Read results are cached per call and
+    revalidated with If-None-Match.
+    """
+
+    def __init__(self, url: str, timeout: float = 30):
+        self.db_name = url.rstrip("/")
+        self.timeout = timeout
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name in READ_METHODS:
+            return lambda *args, **kwargs: self._read(name, args, kwargs)
+        if name in WRITE_METHODS:
+            return lambda *args, **kwargs: self.call_batch([(name, args, kwargs)])[0]
+        raise AttributeError(name)
+
+    def _request(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers.get("ETag"), json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, e.headers.get("ETag"), None
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            logging.error(f"Finance service error {e.code}: {message}")
+            if e.code == 400:
+                raise ValueError(message) from e
+            raise RemoteDatabaseError(message) from e
+        except urllib.error.URLError as e:
+            logging.error(f"Finance service unreachable at {self.db_name}: {e.reason}")
+            raise RemoteDatabaseError(f"Service unreachable: {e.reason}") from e
+
+    def _read(self, method: str, args: tuple, kwargs: dict):
+        query = urllib.parse.urlencode({
+            "args": json.dumps(list(args), default=_to_json),
+            "kwargs": json.dumps(kwargs, default=_to_json),
+        })
+        url = f"{self.db_name}/api/{method}?{query}"
+        with self._cache_lock:
+            cached = self._cache.get(url)
+        request = urllib.request.Request(url)
+        if cached:
+            request.add_header("If-None-Match", cached[0])
+        status, etag, payload = self._request(request)
+        if status == 304 and cached:
+            result = cached[1]
+        else:
+            result = payload["result"]
+            if etag:
+                with self._cache_lock:
+                    self._cache[url] = (etag, result)
+        record = RECORD_TYPES.get(method)
+        return [record(*row) for row in result] if record else result
+
+    def iter_expenses(self, filter=None, batch_size: int = None):
+        """Same records as DatabaseManager.iter_expenses, fetched in one request."""
+        filter = ExpenseFilter.coerce(filter).as_dict()
+        return iter(self._read("get_expenses", (filter,), {}))
+
+    def call_batch(self, calls: list) -> list:
+        """Sends several write calls as (method, args, kwargs) in one request."""
+        body = json.dumps({
+            "calls": [{"method": m, "args": list(a), "kwargs": k} for m, a, k in calls]
+        }, default=_to_json).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.db_name}/api/batch", data=body, method="POST",
+            headers={"Content-Type": "application/json"}
+        )
+        return self._request(request)[2]["results"]
+
+    # Schema and storage management stay with the process that owns the file.
+    def create_budget_table(self) -> None:
+        pass
+
+    def schedule_backups(self, *args, **kwargs) -> None:
+        logging.info("Backups are managed by the finance service.")
+
+    def run_maintenance(self, *args, **kwargs) -> dict:
+        return {}
+
+    def needs_vacuum_convert(self) -> bool:
+        return False
+
+    def backup(self, *args, **kwargs):
+        raise RemoteDatabaseError("Backups are managed by the finance service.")
+
+    def restore_backup(self, *args, **kwargs):
+        raise RemoteDatabaseError("Restores are managed by the finance service.")
+
+    def close(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+
+def open_database(target: str, **options):
+    """
+    Returns a RemoteDatabaseManager for service URLs, otherwise a
+    DatabaseManager created with ``options``, which the service ignores.
+    """
+    if target.startswith(("http://", "https://")):
+        return RemoteDatabaseManager(target)
+    return DatabaseManager(target, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an expenses database over HTTP/JSON.")
+    parser.add_argument("--db", default="expenses.db", help="path of the SQLite database")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="size of the reader pool")
+    args = parser.parse_args()
+
+    service = FinanceService(args.db, args.host, args.port, args.readers)
+    print(f"Serving {args.db} on {service.url}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
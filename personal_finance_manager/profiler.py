@@ -0,0 +1,166 @@
+"""
+Opt-in profiling for field traces.
+
+Methods are wrapped at class level, before any window binds them as
+callbacks, so every Tk callback, chart redraw and database call is recorded
+as a tagged span (``ui:``, ``chart:``, ``tree:``, ``query:``). On exit the
+profiler writes:
+
+- ``profile-<timestamp>.folded``: collapsed stacks weighted by self time in
+  microseconds, readable by flamegraph.pl, speedscope or inferno;
+- ``profile-<timestamp>.txt``: a summary table, also printed to stderr;
+- ``profile-<timestamp>.pstats``: a cProfile dump, in ``cprofile`` mode only.
+
+Enable with ``python finance_app.py --profile [spans|cprofile]`` or by
+setting PFM_PROFILE=1 (or PFM_PROFILE=cprofile).
+"""
+import atexit
+import collections
+import contextlib
+import cProfile
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = "PFM_PROFILE"
+PROFILE_MODES = ("spans", "cprofile")
+SUMMARY_ROWS = 30
+
+
+def profile_mode_from_env():
+    """Returns the profiling mode requested through PFM_PROFILE, or None."""
+    value = os.getenv(PROFILE_ENV, "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    return value if value in PROFILE_MODES else "spans"
+
+
+class Profiler:
+    """Records nested, tagged spans per thread and reports them on exit."""
+
+    def __init__(self, out_dir: str, cprofile: bool = False):
+        self.out_dir = out_dir
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.folded = collections.Counter()  # stack of labels -> self seconds
+        self.stats = {}  # label -> [calls, total seconds, self seconds, max seconds]
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._started = None
+
+    @contextlib.contextmanager
+    def span(self, label: str):
+        """Times the enclosed block as ``label``, nested under the thread's open span."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [label, time.perf_counter(), 0.0]  # label, start, time spent in children
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            own = elapsed - frame[2]
+            if stack:
+                stack[-1][2] += elapsed
+            path = tuple(f[0] for f in stack) + (label,)
+            with self._lock:
+                self.folded[path] += own
+                entry = self.stats.setdefault(label, [0, 0.0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += own
+                entry[3] = max(entry[3], elapsed)
+
+    def wrap(self, func, label: str):
+        """Returns ``func`` wrapped in a span; generators are timed per item."""
+        if getattr(func, "_profiled", False):
+            return func
+        if inspect.isgeneratorfunction(inspect.unwrap(func)):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(label):
+                    items = func(*args, **kwargs)
+                while True:
+                    # Only the time spent producing each item is the
+                    # generator's; the caller's loop body is not.
+                    with self.span(label):
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            return
+                    yield item
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(label):
+                    return func(*args, **kwargs)
+        wrapper._profiled = True
+        return wrapper
+
+    def instrument(self, cls, kind: str, names=None, overrides: dict = None) -> None:
+        """
+        Wraps the methods ``cls`` defines (or just ``names``, which may be
+        inherited) in spans labelled ``kind:Class.method``. ``overrides`` maps
+        method names to a different kind.
+        """
+        overrides = overrides or {}
+        candidates = names if names is not None else [n for n in vars(cls) if not n.startswith("__")]
+        for name in candidates:
+            attr = inspect.getattr_static(cls, name, None)
+            label = f"{overrides.get(name, kind)}:{cls.__name__}.{name}"
+            if isinstance(attr, staticmethod):
+                setattr(cls, name, staticmethod(self.wrap(attr.__func__, label)))
+            elif isinstance(attr, classmethod):
+                setattr(cls, name, classmethod(self.wrap(attr.__func__, label)))
+            elif inspect.isfunction(attr):
+                setattr(cls, name, self.wrap(attr, label))
+
+    def start(self) -> None:
+        """Starts recording and arranges for the report to be written at exit."""
+        self._started = time.perf_counter()
+        if self._cprofile:
+            self._cprofile.enable()
+        atexit.register(self.report)
+
+    def summary(self) -> str:
+        """Formats the busiest spans by self time as a table."""
+        wall = time.perf_counter() - self._started if self._started else 0.0
+        lines = [
+            f"Profiled {wall:.1f}s of wall time.",
+            f"{'span':<52} {'calls':>7} {'total ms':>10} {'self ms':>10} {'mean ms':>9} {'max ms':>9}",
+        ]
+        with self._lock:
+            rows = sorted(self.stats.items(), key=lambda item: item[1][2], reverse=True)
+        for label, (calls, total, own, longest) in rows[:SUMMARY_ROWS]:
+            lines.append(
+                f"{label:<52} {calls:>7} {total * 1000:>10.1f} {own * 1000:>10.1f} "
+                f"{total / calls * 1000:>9.2f} {longest * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def report(self) -> str:
+        """Writes the collapsed stacks, summary and optional cProfile dump; returns the prefix."""
+        atexit.unregister(self.report)
+        if self._cprofile:
+            self._cprofile.disable()
+        os.makedirs(self.out_dir, exist_ok=True)
+        prefix = os.path.join(self.out_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        with self._lock:
+            folded = sorted(self.folded.items())
+        with open(prefix + ".folded", "w", encoding="utf-8") as f:
+            for path, seconds in folded:
+                weight = round(seconds * 1_000_000)
+                if weight:
+                    f.write(f"{';'.join(path)} {weight}\n")
+        summary = self.summary()
+        with open(prefix + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+        if self._cprofile:
+            self._cprofile.dump_stats(prefix + ".pstats")
+        print(summary, file=sys.stderr)
+        print(f"Profile written to {prefix}.*", file=sys.stderr)
+        return prefix
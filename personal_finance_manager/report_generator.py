@@ -0,0 +1,247 @@
+"""
+Monthly report pages, rendered headlessly.
+
+Every page shows the month's spending by category (pie), budget against
+spending (bars), the daily trend with a running total, and the largest
+expenses. The data for all months comes from one pass over the database:
+the rollups for totals and one streamed read of the period for the top
+expenses. The pages are then drawn in parallel by a process pool, using
+matplotlib's Agg canvas directly, so no display or GUI backend is needed.
+
+    python report_generator.py --year 2024 --out reports
+    python report_generator.py --from 2024-01 --to 2024-06 --format pdf --db expenses.db
+"""
+import argparse
+import calendar
+import heapq
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from database_manager import ExpenseFilter
+from finance_service import open_database
+from logging_config import logging
+
+REPORT_FORMATS = ("png", "pdf")
+TOP_EXPENSES = 10
+PAGE_SIZE = (11.69, 8.27)  # A4 landscape, in inches
+PAGE_DPI = 120
+DESCRIPTION_WIDTH = 40
+
+
+def default_database() -> str:
+    """The database the app opens when started without --db."""
+    appdata = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(appdata, "PersonalFinanceManager", "expenses.db")
+
+
+def _month_arg(text: str) -> str:
+    try:
+        return date.fromisoformat(f"{text}-01").strftime("%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a month as YYYY-MM, got {text!r}")
+
+
+def months_between(first: str, last: str) -> list:
+    """Returns the YYYY-MM keys from ``first`` to ``last`` inclusive."""
+    year, month = int(first[:4]), int(first[5:7])
+    months = []
+    while f"{year:04d}-{month:02d}" <= last:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def collect_report_data(db, months: list, top_n: int = TOP_EXPENSES) -> list:
+    """
+    Gathers everything the pages need for ``months`` (YYYY-MM keys) in one
+    pass and returns one plain, picklable dict per month.
+    """
+    months = sorted(set(months))
+    start = f"{months[0]}-01"
+    last_year, last_month = int(months[-1][:4]), int(months[-1][5:7])
+    end = f"{months[-1]}-{calendar.monthrange(last_year, last_month)[1]:02d}"
+    budgets = {category: budget for category, budget, _spent in db.get_all_budgets()}
+    pages = {
+        month: {"month": month, "categories": {}, "count": 0, "daily": {}, "budgets": budgets, "top": []}
+        for month in months
+    }
+
+    for month, category, total, count in db.get_period_totals("month", start, end):
+        if month in pages:
+            pages[month]["categories"][category] = total
+            pages[month]["count"] += count
+    for day, total in db.get_daily_totals(start, end):
+        if day[:7] in pages:
+            pages[day[:7]]["daily"][day] = total
+
+    # Keep only the largest few per month while streaming the period.
+    heaps = {month: [] for month in months}
+    flt = ExpenseFilter(start=start, end=end, include_archived=True)
+    for expense_id, day, amount, category, description in db.iter_expenses(flt):
+        heap = heaps.get(day[:7])
+        if heap is None:
+            continue
+        entry = (amount, expense_id, (day, amount, category, description or ""))
+        if len(heap) < top_n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    for month, heap in heaps.items():
+        pages[month]["top"] = [row for _amount, _id, row in sorted(heap, reverse=True)]
+    return [pages[month] for month in months]
+
+
+def _draw_pie(ax, page: dict) -> None:
+    categories = {c: t for c, t in page["categories"].items() if t > 0}
+    ax.set_title("Spending by Category")
+    if not categories:
+        ax.text(0.5, 0.5, "No spending", ha="center", va="center")
+        ax.axis("off")
+        return
+    ax.pie(list(categories.values()), labels=list(categories), autopct="%1.1f%%", startangle=140)
+    ax.axis("equal")
+
+
+def _draw_budget_bars(ax, page: dict) -> None:
+    names = sorted(set(page["budgets"]) | set(page["categories"]))
+    ax.set_title("Budget vs Spending")
+    if not names:
+        ax.axis("off")
+        return
+    positions = range(len(names))
+    ax.bar([p - 0.2 for p in positions], [page["budgets"].get(n, 0.0) for n in names],
+           width=0.4, label="Budget", color="#8fb8de")
+    ax.bar([p + 0.2 for p in positions], [page["categories"].get(n, 0.0) for n in names],
+           width=0.4, label="Spent", color="#e07a5f")
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels(names, rotation=30, ha="right")
+    ax.set_ylabel("Amount ($)")
+    ax.legend()
+
+
+def _draw_trend(ax, page: dict) -> None:
+    year, month = int(page["month"][:4]), int(page["month"][5:])
+    days = range(1, calendar.monthrange(year, month)[1] + 1)
+    amounts = [page["daily"].get(f"{page['month']}-{d:02d}", 0.0) for d in days]
+    running, total = [], 0.0
+    for amount in amounts:
+        total += amount
+        running.append(total)
+    ax.set_title("Daily Spending")
+    ax.bar(list(days), amounts, color="#81b29a", label="Per day")
+    ax.set_xlabel("Day of month")
+    ax.set_ylabel("Amount ($)")
+    cumulative = ax.twinx()
+    cumulative.plot(list(days), running, color="#3d405b", label="Running total")
+    cumulative.set_ylabel("Running total ($)")
+    ax.grid(True, linestyle="--", alpha=0.6)
+
+
+def _draw_top_expenses(ax, page: dict) -> None:
+    ax.set_title(f"Top {len(page['top'])} Expenses" if page["top"] else "Top Expenses")
+    ax.axis("off")
+    if not page["top"]:
+        return
+    rows = [
+        [day, f"${amount:.2f}", category,
+         description if len(description) <= DESCRIPTION_WIDTH else description[:DESCRIPTION_WIDTH - 1] + "…"]
+        for day, amount, category, description in page["top"]
+    ]
+    table = ax.table(cellText=rows, colLabels=["Date", "Amount", "Category", "Description"],
+                     loc="upper center", cellLoc="left", colWidths=[0.17, 0.13, 0.2, 0.5])
+    table.auto_set_font_size(False)
+    table.set_fontsize(8)
+    table.scale(1, 1.3)
+
+
+def render_month(page: dict, out_dir: str, fmt: str = "png") -> str:
+    """Draws one month's page with the Agg canvas and returns the file written."""
+    year, month = int(page["month"][:4]), int(page["month"][5:])
+    fig = Figure(figsize=PAGE_SIZE)
+    FigureCanvasAgg(fig)
+    total = sum(page["categories"].values())
+    fig.suptitle(f"{calendar.month_name[month]} {year}: ${total:,.2f} over {page['count']} expenses",
+                 fontsize=14)
+    grid = fig.add_gridspec(2, 2)
+    _draw_pie(fig.add_subplot(grid[0, 0]), page)
+    _draw_budget_bars(fig.add_subplot(grid[0, 1]), page)
+    _draw_trend(fig.add_subplot(grid[1, 0]), page)
+    _draw_top_expenses(fig.add_subplot(grid[1, 1]), page)
+    fig.tight_layout(rect=(0, 0, 1, 0.95))
+    path = os.path.join(out_dir, f"report-{page['month']}.{fmt}")
+    fig.savefig(path, dpi=PAGE_DPI, format=fmt)
+    return path
+
+
+def render_reports(pages: list, out_dir: str, fmt: str = "png", workers: int = None) -> list:
+    """
+    Renders the pages from collect_report_data, in parallel unless there is
+    only one page or one worker, and returns the files written in month order.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    if workers == 1 or len(pages) <= 1:
+        return [render_month(page, out_dir, fmt) for page in pages]
+    # Spawned workers: forking a process that runs Tk or other threads is unsafe.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or min(len(pages), os.cpu_count() or 1),
+                             mp_context=context) as pool:
+        return list(pool.map(render_month, pages, repeat(out_dir), repeat(fmt)))
+
+
+def generate_reports(db, months: list, out_dir: str, fmt: str = "png", workers: int = None) -> list:
+    """Collects the data for ``months`` and renders one page per month; returns the files."""
+    paths = render_reports(collect_report_data(db, months), out_dir, fmt, workers)
+    logging.info(f"Generated {len(paths)} monthly reports in {out_dir}")
+    return paths
+
+
+def main():
+    today = date.today()
+    parser = argparse.ArgumentParser(description="Render monthly spending reports as PNG or PDF pages.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", help="path of the expenses database (default: the app's database)")
+    source.add_argument("--server", help="URL of a running finance service")
+    parser.add_argument("--year", type=int, default=today.year,
+                        help="report every month of this year, up to the current month")
+    parser.add_argument("--from", dest="first", type=_month_arg, help="first month to report, as YYYY-MM")
+    parser.add_argument("--to", dest="last", type=_month_arg, help="last month to report, as YYYY-MM")
+    parser.add_argument("--out", default="reports", help="directory for the report files")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default="png")
+    parser.add_argument("--workers", type=int, help="rendering processes (default: one per core)")
+    args = parser.parse_args()
+
+    current = f"{today.year:04d}-{today.month:02d}"
+    first = args.first or f"{args.year:04d}-01"
+    last = args.last or min(f"{args.year:04d}-12", current)
+    months = months_between(first, last)
+    if not months:
+        sys.exit(f"No months between {first} and {last}.")
+
+    target = args.server or args.db or default_database()
+    if not args.server and not os.path.exists(target):
+        sys.exit(f"No database at {target}.")
+    db = open_database(target)
+    try:
+        started = time.perf_counter()
+        pages = collect_report_data(db, months)
+        collected = time.perf_counter()
+        paths = render_reports(pages, args.out, args.format, args.workers)
+    finally:
+        db.close()
+    finished = time.perf_counter()
+    for path in paths:
+        print(path)
+    print(f"{len(paths)} reports: data in {collected - started:.2f}s, "
+          f"rendering in {finished - collected:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
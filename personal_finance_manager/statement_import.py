@@ -0,0 +1,297 @@
+"""
+Streaming importers for bank statements.
+
+OFX/QFX files (SGML 1.x or XML 2.x) are tokenised a chunk at a time and QIF
+files a line at a time, so a multi-year statement never has to fit in
+memory. Debits become expenses; credits (deposits, refunds) are skipped.
+Each payee is mapped to a category through the payee rules table, and the
+transactions are written in batches through
+DatabaseManager.add_statement_rows, which skips anything already imported:
+by the bank's FITID for OFX/QFX, by content for QIF (which has no ids).
+Because of that an interrupted import can simply be run again.
+"""
+import codecs
+import html
+import os
+import re
+from datetime import datetime
+from logging_config import logging
+
+STATEMENT_EXTENSIONS = (".ofx", ".qfx", ".qif")
+
+# Statement transactions written per database commit.
+IMPORT_BATCH_SIZE = 1000
+OFX_CHUNK_SIZE = 64 * 1024
+DEFAULT_CATEGORY = "Others"
+MAX_DESCRIPTION = 255
+# Distinct payees remembered by PayeeCategorizer before it starts over.
+PAYEE_CACHE_SIZE = 10_000
+
+# A start or end tag and the text up to the next tag. SGML OFX leaves leaf
+# elements unclosed (<TRNAMT>-12.50<FITID>...), XML OFX closes them.
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9_.]+)>([^<]*)")
+
+# QIF sections holding bank-style transactions; others (investments, the
+# category and memorized lists) are skipped.
+_QIF_TRANSACTION_TYPES = {"bank", "cash", "ccard", "oth a", "oth l"}
+_QIF_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y")
+
+
+class Transaction:
+    """A debit read from a statement; ``amount`` is positive."""
+
+    __slots__ = ("date", "amount", "payee", "memo", "fitid", "category")
+
+    def __init__(self, date, amount, payee, memo="", fitid=None, category=None):
+        self.date = date
+        self.amount = amount
+        self.payee = payee
+        self.memo = memo
+        self.fitid = fitid
+        self.category = category
+
+    def description(self) -> str:
+        """The payee, followed by the memo when it adds anything."""
+        text = self.payee or self.memo
+        if self.memo and self.payee and self.memo.lower() not in self.payee.lower():
+            text = f"{self.payee} - {self.memo}"
+        return text[:MAX_DESCRIPTION]
+
+    def __repr__(self):
+        return f"Transaction({self.date}, {self.amount}, {self.payee!r}, fitid={self.fitid!r})"
+
+
+class PayeeCategorizer:
+    """
+    Maps payees to categories using (pattern, category, priority) rules
+    ordered as DatabaseManager.get_payee_rules returns them. The first rule
+    whose pattern occurs in the payee wins; answers are cached per payee.
+    """
+
+    def __init__(self, rules, default: str = DEFAULT_CATEGORY):
+        self.rules = [(str(pattern).lower(), category) for pattern, category, _priority in rules]
+        self.default = default
+        self._cache = {}
+
+    def category(self, payee: str, fallback: str = None) -> str:
+        """Returns the matching rule's category, else ``fallback``, else the default."""
+        key = (payee or "").lower()
+        try:
+            match = self._cache[key]
+        except KeyError:
+            match = next((category for pattern, category in self.rules if pattern in key), None)
+            if len(self._cache) >= PAYEE_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = match
+        return match or fallback or self.default
+
+
+def parse_amount(text: str) -> float:
+    """Parses a statement amount, accepting 1,234.56 as well as 1.234,56 and 12,50."""
+    text = text.strip().replace(" ", "").replace("$", "")
+    if "," in text and "." in text:
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        decimal = re.fullmatch(r"[-+]?\d+,\d{1,2}", text)
+        text = text.replace(",", "." if decimal else "")
+    return float(text)
+
+
+def _detect_encoding(path: str) -> str:
+    """Reads the encoding an OFX header declares; defaults to UTF-8 (BOM or not)."""
+    with open(path, "rb") as f:
+        head = f.read(1024).decode("ascii", "replace")
+    match = re.search(r'encoding="([\w-]+)"', head, re.I) or re.search(r"CHARSET:\s*([\w-]+)", head)
+    encoding = match.group(1) if match else "utf-8-sig"
+    if encoding.isdigit():
+        encoding = f"cp{encoding}"
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return "utf-8-sig"
+
+
+# --- OFX / QFX --------------------------------------------------------------
+
+def iter_ofx_tokens(f, chunk_size: int = OFX_CHUNK_SIZE):
+    """Yields (closing, tag, text) for every tag in an OFX stream, a chunk at a time."""
+    buffer = ""
+    while True:
+        chunk = f.read(chunk_size)
+        buffer += chunk
+        if chunk:
+            # Hold back the last tag: its text may continue in the next chunk.
+            cut = buffer.rfind("<")
+            if cut <= 0:
+                continue
+            text, buffer = buffer[:cut], buffer[cut:]
+        else:
+            text, buffer = buffer, ""
+        for match in _OFX_TAG.finditer(text):
+            yield match.group(1) == "/", match.group(2).upper(), html.unescape(match.group(3).strip())
+        if not chunk:
+            return
+
+
+def iter_ofx_records(f, chunk_size: int = OFX_CHUNK_SIZE):
+    """
+    Yields the fields of every <STMTTRN> as a dict of tag -> text, with the
+    statement's account id under ``ACCOUNT``.
+    """
+    account = None
+    current = None
+    for closing, tag, text in iter_ofx_tokens(f, chunk_size):
+        if tag == "STMTTRN":
+            if current is not None:
+                yield current
+            current = None if closing else {"ACCOUNT": account}
+        elif current is not None:
+            if not closing and text and tag not in current:
+                current[tag] = text
+        elif tag == "ACCTID" and text:
+            account = text
+    if current is not None:
+        yield current
+
+
+def ofx_transaction(fields: dict):
+    """Converts an OFX record to a Transaction; None for credits. Raises ValueError if unreadable."""
+    try:
+        amount = parse_amount(fields["TRNAMT"])
+        posted = fields["DTPOSTED"][:8]
+    except KeyError as e:
+        raise ValueError(f"transaction without {e.args[0]}") from None
+    if amount >= 0:
+        return None
+    date = datetime.strptime(posted, "%Y%m%d").strftime("%Y-%m-%d")
+    fitid = fields.get("FITID")
+    if fitid and fields.get("ACCOUNT"):
+        # FITIDs are only unique within one account.
+        fitid = f"{fields['ACCOUNT']}:{fitid}"
+    payee = fields.get("NAME") or fields.get("PAYEEID") or ""
+    return Transaction(date, round(-amount, 2), payee, fields.get("MEMO", ""), fitid)
+
+
+# --- QIF --------------------------------------------------------------------
+
+def iter_qif_records(f):
+    """Yields the fields of every bank-style QIF transaction as a dict of code -> text."""
+    wanted = True
+    record = {}
+    for line in f:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line.startswith("!"):
+            header = line[1:].strip().lower()
+            if header.startswith("type:"):
+                wanted = header[5:].strip() in _QIF_TRANSACTION_TYPES
+            elif header == "account":
+                # An account list follows, until the next !Type: header.
+                wanted = False
+            record = {}
+        elif line.startswith("^"):
+            if wanted and record:
+                yield record
+            record = {}
+        else:
+            # Split lines (S, E, $) repeat; the first value of each code is kept.
+            record.setdefault(line[0], line[1:].strip())
+    if wanted and record:
+        yield record
+
+
+def parse_qif_date(text: str) -> str:
+    """Parses QIF dates such as 12/31/2024, 12/31'24, 1/ 5'24 or 2024-12-31."""
+    text = text.replace("'", "/").replace(" ", "")
+    for fmt in _QIF_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date {text!r}")
+
+
+def qif_transaction(fields: dict):
+    """Converts a QIF record to a Transaction; None for credits. Raises ValueError if unreadable."""
+    try:
+        amount = parse_amount(fields.get("T") or fields["U"])
+        date = parse_qif_date(fields["D"])
+    except KeyError as e:
+        raise ValueError(f"transaction without {e.args[0]}") from None
+    if amount >= 0:
+        return None
+    # "Food:Groceries/Class" -> "Food"; "[Savings]" is a transfer, not a category.
+    category = fields.get("L", "").split("/")[0].split(":")[0].strip()
+    if category.startswith("["):
+        category = ""
+    return Transaction(date, round(-amount, 2), fields.get("P", ""), fields.get("M", ""),
+                       category=category or None)
+
+
+# --- Import -----------------------------------------------------------------
+
+def iter_statement(path: str):
+    """
+    Yields a Transaction, None (a credit) or a ValueError (an unreadable
+    record) for every transaction in an OFX, QFX or QIF file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".ofx", ".qfx"):
+        reader, convert = iter_ofx_records, ofx_transaction
+    elif extension == ".qif":
+        reader, convert = iter_qif_records, qif_transaction
+    else:
+        raise ValueError(f"Unsupported statement format: {extension or path}")
+    with open(path, encoding=_detect_encoding(path), errors="replace", newline=None) as f:
+        for record in reader(f):
+            try:
+                yield convert(record)
+            except ValueError as e:
+                yield e
+
+
+def import_statement(db, path: str, batch_size: int = IMPORT_BATCH_SIZE,
+                     default_category: str = DEFAULT_CATEGORY) -> dict:
+    """
+    Streams the debits of a statement into ``db`` (a DatabaseManager or
+    RemoteDatabaseManager) and returns the number of imported, duplicate,
+    credit and unreadable transactions.
+    """
+    categorizer = PayeeCategorizer(db.get_payee_rules(), default_category)
+    counts = {"imported": 0, "duplicates": 0, "credits": 0, "unreadable": 0}
+    batch = []
+    # Transactions without a FITID seen so far, by content, so identical
+    # debits in one statement are told apart from ones imported before.
+    seen = {}
+
+    def write():
+        imported = db.add_statement_rows(batch)
+        counts["imported"] += imported
+        counts["duplicates"] += len(batch) - imported
+        batch.clear()
+
+    for item in iter_statement(path):
+        if item is None:
+            counts["credits"] += 1
+            continue
+        if isinstance(item, ValueError):
+            counts["unreadable"] += 1
+            logging.warning(f"Skipped unreadable transaction in {path}: {item}")
+            continue
+        category = categorizer.category(item.payee, item.category)
+        description = item.description()
+        occurrence = 1
+        if item.fitid is None:
+            key = (item.date, round(item.amount * 100), category.lower(), (description or "").strip())
+            occurrence = seen[key] = seen.get(key, 0) + 1
+        batch.append((item.date, item.amount, category, description, item.fitid, occurrence))
+        if len(batch) >= batch_size:
+            write()
+    if batch:
+        write()
+    logging.info(f"Imported statement {path}: {counts}")
+    return counts
@@ -0,0 +1,100 @@
+"""
+Multi-process stress test for DatabaseManager.
+
+Starts several processes that insert expenses one at a time into the same
+database file while regularly reading category totals, then checks that no
+acknowledged insert was lost and the rollups still match, e.g.:
+
+    python stress_test.py --processes 8 --rows 500
+
+Exits with status 1 if a write went missing or the rollups disagree.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from database_manager import BUSY_TIMEOUT_SECONDS, DEFAULT_CATEGORIES, DatabaseManager
+
+
+def worker(db_file: str, run: str, worker_id: int, rows: int, aggregate_every: int,
+           busy_timeout: float) -> tuple:
+    """Inserts ``rows`` expenses; returns (worker, inserted, failed, reads, contention stats)."""
+    db = DatabaseManager(db_file, busy_timeout=busy_timeout)
+    inserted = failed = reads = 0
+    try:
+        for i in range(rows):
+            try:
+                db.add_expense(
+                    f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    round(1 + (i % 100) * 0.37, 2),
+                    DEFAULT_CATEGORIES[i % len(DEFAULT_CATEGORIES)],
+                    f"stress {run} w{worker_id} #{i}",
+                )
+                inserted += 1
+            except sqlite3.OperationalError:
+                # Gave up after every retry; the row must then be absent.
+                failed += 1
+            if aggregate_every and i % aggregate_every == 0:
+                db.get_category_totals()
+                reads += 1
+        return worker_id, inserted, failed, reads, db.contention_stats()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress DatabaseManager with concurrent writer processes.")
+    parser.add_argument("--processes", type=int, default=max(2, os.cpu_count() or 2))
+    parser.add_argument("--rows", type=int, default=500, help="inserts per process")
+    parser.add_argument("--aggregate-every", type=int, default=25,
+                        help="read category totals after this many inserts (0 = never)")
+    parser.add_argument("--busy-timeout", type=float, default=BUSY_TIMEOUT_SECONDS,
+                        help="seconds a connection waits for the write lock")
+    parser.add_argument("--db", help="database to hammer (default: a throwaway file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db or os.path.join(tmp, "stress.db")
+        # Create or migrate the schema once, before the workers race for it.
+        DatabaseManager(db_file).close()
+        run = f"{os.getpid()}-{int(time.time())}"
+
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(worker, [
+                (db_file, run, n, args.rows, args.aggregate_every, args.busy_timeout)
+                for n in range(args.processes)
+            ])
+        elapsed = time.perf_counter() - started
+
+        with DatabaseManager(db_file) as db:
+            stored = db.conn.execute(
+                "SELECT COUNT(*) FROM expenses WHERE description LIKE ?", (f"stress {run} %",)
+            ).fetchone()[0]
+            mismatches = db.check_rollups()
+
+    print(f"{'worker':>6} {'inserted':>9} {'failed':>7} {'reads':>6} {'busy':>5} "
+          f"{'retries':>8} {'max write ms':>13}")
+    for worker_id, inserted, failed, reads, stats in results:
+        print(f"{worker_id:>6} {inserted:>9} {failed:>7} {reads:>6} {stats['busy_errors']:>5} "
+              f"{stats['retries']:>8} {stats['max_write_seconds'] * 1000:>13.1f}")
+
+    acknowledged = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    reads = sum(r[3] for r in results)
+    print(f"\n{acknowledged} inserts and {reads} aggregate reads in {elapsed:.2f}s "
+          f"({acknowledged / elapsed:.0f} inserts/s, {reads / elapsed:.0f} reads/s); "
+          f"{failed} inserts gave up after retrying.")
+    print(f"Rows stored: {stored} (expected {acknowledged}); rollup mismatches: {mismatches}.")
+
+    if stored != acknowledged or mismatches:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
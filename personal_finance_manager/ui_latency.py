@@ -0,0 +1,285 @@
+"""
+UI latency harness for FinanceApp and BudgetManager.
+
+Drives the real windows against seeded databases of increasing size and
+records, per interaction, the wall-clock time from the simulated click until
+the Tk event queue is idle again (redraws included). Message boxes are
+stubbed so nothing blocks. Runs under a virtual X display: an existing
+DISPLAY is used, otherwise Xvfb is started for the run, e.g.:
+
+    python ui_latency.py --sizes 1000 10000 100000 --save-baseline ui_baseline.json
+    python ui_latency.py --sizes 1000 10000 100000 --baseline ui_baseline.json
+
+With --baseline, exits with status 1 when an interaction got slower than
+the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_REPEAT = 5
+# A slowdown counts as a regression only past both limits, so timer noise on
+# fast interactions doesn't fail the run.
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_DELTA_MS = 5.0
+XVFB_DISPLAY = 99
+XVFB_WAIT_SECONDS = 10
+
+
+def start_xvfb():
+    """Starts Xvfb on a free display number and returns (process, display)."""
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        sys.exit("No DISPLAY set and Xvfb is not installed.")
+    number = XVFB_DISPLAY
+    while os.path.exists(f"/tmp/.X11-unix/X{number}"):
+        number += 1
+    process = subprocess.Popen(
+        [xvfb, f":{number}", "-screen", "0", "1600x900x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + XVFB_WAIT_SECONDS
+    while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            sys.exit("Xvfb failed to start.")
+        time.sleep(0.05)
+    return process, f":{number}"
+
+
+# --- Child process: one database size -------------------------------------
+
+def stub_dialogs(dialogs: list) -> None:
+    """Replaces blocking dialogs with stubs that record the call and answer yes."""
+    import tkinter as tk
+    from tkinter import messagebox, simpledialog
+
+    def stub(kind, answer):
+        def record(*args, **kwargs):
+            dialogs.append((kind, " ".join(str(a) for a in args)))
+            return answer
+        return record
+
+    for name in ("showinfo", "showwarning", "showerror"):
+        setattr(messagebox, name, stub(name, "ok"))
+    for name in ("askyesno", "askokcancel", "askyesnocancel"):
+        setattr(messagebox, name, stub(name, True))
+    simpledialog.askfloat = stub("askfloat", 1.0)
+    simpledialog.askstring = stub("askstring", None)
+    # The .ico window icons are Windows-only.
+    tk.Wm.iconbitmap = lambda self, *args, **kwargs: None
+
+
+def wait_idle(root) -> None:
+    """Processes pending Tk events and idle callbacks until none are left."""
+    import _tkinter
+    while root.tk.dooneevent(_tkinter.ALL_EVENTS | _tkinter.DONT_WAIT):
+        pass
+
+
+def seed_database(path: str, size: int) -> None:
+    from benchmark import CATEGORIES, make_rows
+    from database_manager import DatabaseManager
+    with DatabaseManager(path) as db:
+        db.add_expenses_bulk(make_rows(size))
+        for category in CATEGORIES:
+            db.add_or_update_budget(category, size * 10.0)
+
+
+def interactions(app, counter):
+    """Yields (name, action) pairs in the order a user might perform them."""
+
+    def add_expense():
+        counter[0] += 1
+        app.date_entry.set(time.strftime("%Y-%m-%d"))
+        app.amount_entry.delete(0, "end")
+        app.amount_entry.insert(0, "12.34")
+        app.category_combobox.set(app.categories[0])
+        app.desc_text.delete("1.0", "end")
+        app.desc_text.insert("1.0", f"latency probe {counter[0]}")
+        app.add_expense()
+
+    def apply_preset(preset):
+        def apply():
+            app.date_preset_combobox.set(preset)
+            app.apply_date_preset()
+        return apply
+
+    def search():
+        app.search_entry.delete(0, "end")
+        app.search_entry.insert(0, "Expense 1")
+        app.load_expenses()
+
+    def delete_expense():
+        items = app.tree.get_children()
+        if items:
+            app.tree.selection_set(items[0])
+        app.delete_expense()
+
+    def budget_window():
+        return app.budget_manager
+
+    def set_budget():
+        manager = budget_window()
+        manager.category_combobox.set(app.categories[0])
+        manager.budget_entry.delete(0, "end")
+        manager.budget_entry.insert(0, "1000")
+        manager.set_budget()
+
+    yield "add expense", add_expense
+    yield "apply: this month", apply_preset("This month")
+    yield "apply: last 90 days", apply_preset("Last 90 days")
+    yield "apply: year to date", apply_preset("Year to date")
+    yield "search", search
+    yield "clear filters", app.clear_filters
+    yield "sort by amount", lambda: app.sort_treeview("amount", False)
+    yield "sort by date", lambda: app.sort_treeview("date", True)
+    yield "toggle theme", app._toggle_theme
+    yield "delete expense", delete_expense
+    yield "open budget manager", app.manage_budgets
+    yield "set budget", set_budget
+    yield "budget vs spending", lambda: budget_window().show_budget_vs_spending()
+    yield "toggle theme (with budgets open)", app._toggle_theme
+
+
+def run_size(size: int, repeat: int) -> dict:
+    """Seeds a database of ``size`` rows and times every interaction ``repeat`` times."""
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the app's scheduled backups and data files out of the real profile.
+        os.environ["LOCALAPPDATA"] = tmp
+        db_file = os.path.join(tmp, "latency.db")
+        seed_database(db_file, size)
+
+        dialogs = []
+        stub_dialogs(dialogs)
+        import ttkbootstrap as tb
+        from finance_app import FinanceApp
+
+        root = tb.Window(themename="flatly")
+        timings, errors = {}, {}
+
+        def measure(name, action):
+            dialogs.clear()
+            started = time.perf_counter()
+            action()
+            wait_idle(root)
+            timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            failed = [text for kind, text in dialogs if kind == "showerror"]
+            if failed:
+                errors[name] = failed[-1]
+
+        app = None
+
+        def start():
+            nonlocal app
+            app = FinanceApp(root, db_file=db_file)
+        measure("startup", start)
+
+        counter = [0]
+        for _ in range(repeat):
+            for name, action in interactions(app, counter):
+                measure(name, action)
+            if getattr(app, "budget_manager", None):
+                app.budget_window.destroy()
+                app.budget_manager.db_manager.close()
+                app.budget_manager = None
+            wait_idle(root)
+
+        app.db_manager.close()
+        root.destroy()
+    return {
+        "ms": {name: round(statistics.median(values), 2) for name, values in timings.items()},
+        "errors": errors,
+    }
+
+
+# --- Parent process: sizes, report, baseline ------------------------------
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Returns (size, interaction, baseline ms, current ms) for every regression."""
+    regressions = []
+    for size, current in results.items():
+        before = baseline.get(size, {}).get("ms", {})
+        for name, ms in current["ms"].items():
+            if name in before and ms > before[name] * (1 + tolerance) and ms - before[name] > min_delta_ms:
+                regressions.append((size, name, before[name], ms))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FinanceApp interaction latency under Xvfb.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="number of seeded expenses per run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="times each interaction is repeated; the median is reported")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="write this run's results to a JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before an interaction counts as regressed")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        print(json.dumps(run_size(args.run_size, args.repeat)))
+        return
+
+    xvfb = None
+    env = dict(os.environ)
+    if not env.get("DISPLAY"):
+        xvfb, env["DISPLAY"] = start_xvfb()
+    try:
+        results = {}
+        for size in args.sizes:
+            # A fresh process per size: ttkbootstrap keeps one style per process.
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-size", str(size),
+                 "--repeat", str(args.repeat)],
+                env=env, capture_output=True, text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            if child.returncode != 0:
+                sys.exit(f"Run with {size} rows failed:\n{child.stderr}")
+            results[str(size)] = json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        if xvfb:
+            xvfb.terminate()
+            xvfb.wait()
+
+    names = list(next(iter(results.values()))["ms"])
+    sizes = list(results)
+    print(f"{'interaction (median ms)':<34}" + "".join(f"{size:>12}" for size in sizes))
+    for name in names:
+        print(f"{name:<34}" + "".join(f"{results[size]['ms'].get(name, float('nan')):>12.1f}" for size in sizes))
+    for size in sizes:
+        for name, message in results[size]["errors"].items():
+            print(f"warning: '{name}' showed an error dialog with {size} rows: {message}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions:")
+            for size, name, before, after in regressions:
+                print(f"  {name} @ {size} rows: {before:.1f} ms -> {after:.1f} ms "
+                      f"(+{(after / before - 1) * 100:.0f}%)")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()